@@ -1,3 +1,17 @@
+import os
+import sys
+
+# app.util.admin_helper.FROZEN_ARG, don't import the app package (and its ui dependencies) as root.
+if len(sys.argv) > 1 and sys.argv[1] == '--admin-helper':
+    # packed app executable as interpreter of the privileged helper script (shipped as data file).
+    import runpy
+
+    runtime_dir = getattr(sys, '_MEIPASS', None) or os.getenv('RESOURCEPATH') or os.path.dirname(__file__)
+    path = os.path.join(runtime_dir, 'app', 'util', 'admin_helper.py')
+    sys.argv = [path] + sys.argv[2:]
+    runpy.run_path(path, run_name='__main__')
+    sys.exit(0)
+
 from app import Application
 
 Application().run()
@@ -1,3 +1,5 @@
+import os
+import sys
 import threading
 import time
 from threading import Thread
@@ -10,8 +12,9 @@ from app.config import Config
 from app.res.const import Const
 from app.res.language import load_language, LANGUAGES
 from app.res.language.english import English
-from app.util import system_api, osa_api, github, object_convert, log
+from app.util import system_api, osa_api, github, object_convert, log, admin_helper
 from app.util.log import Log
+from app.util.pmset import PMSetReconciler
 from app.util.process_daemon import ProcessDaemon
 from app.view.application import ApplicationView
 
@@ -21,12 +24,18 @@ class Application(ApplicationBase, ApplicationView):
         ApplicationView.__init__(self)
         ApplicationBase.__init__(self, Config)
 
+        self.admin_helper = admin_helper.AdminHelperClient(
+            Const.admin_helper_socket % os.getuid(), timeout=self.config.process_timeout)
+        self.admin_helper_failed = False
+        self.pmset = PMSetReconciler(self.admin_exec)
         self.menu_cat = []
         self.init_menu()
 
         self.pd_noidle = ProcessDaemon(['/usr/bin/pmset', 'noidle'])
 
         self.battery_status = None  # type: dict
+        # battery status snapshot of rendered view.
+        self.battery_status_view = None
         self.lid_stat = None  # type: bool
 
         # System sleep time. (from pmset)
@@ -52,7 +61,7 @@ class Application(ApplicationBase, ApplicationView):
         # menu_application
         self.set_menu_callback(self.menu_sleep_now, callback=lambda _: self.sleep())
         self.set_menu_callback(self.menu_display_sleep_now, callback=lambda _: system_api.sleep(display_only=True))
-        self.set_menu_callback(self.menu_disable_idle_sleep, callback=lambda sender: self.set_idle_sleep(sender.state))
+        self.set_menu_callback(self.menu_disable_idle_sleep, callback=lambda sender: self.set_idle_sleep(self.view.state(sender)))
         self.set_menu_callback(self.menu_disable_lid_sleep, callback=self.callback_menu_disable_lid_sleep)
         self.set_menu_callback(self.menu_select_language, callback=lambda _: self.select_language())
         self.set_menu_callback(self.menu_check_update, callback=(
@@ -130,24 +139,42 @@ class Application(ApplicationBase, ApplicationView):
         return callback
 
     def callback_menu_disable_lid_sleep(self, sender: rumps.MenuItem):
-        if not self.set_lid_sleep(sender.state):
+        if not self.set_lid_sleep(self.view.state(sender)):
             self.message_box(sender.title, self.lang.description_unable_to_pmset)
 
     def inject_menu_value(self):
         # inject value to menu.
-        self.menu_disable_idle_sleep_in_charging.state = self.config.disable_idle_sleep_in_charging
-        self.menu_disable_lid_sleep_in_charging.state = self.config.disable_lid_sleep_in_charging
-        self.menu_low_battery_capacity_sleep.state = self.config.low_battery_capacity_sleep
-        self.menu_screen_save_on_lid.state = self.config.screen_save_on_lid
-        self.menu_short_time_cancel_screen_save.state = self.config.short_time_cancel_screen_save
-
-        [info, _] = system_api.sleep_info()
-        self.menu_disable_lid_sleep.state = info.get('SleepDisabled', False)
-
-        self.menu_set_lid_status_changed_event.state = self.config.event_lid_status_changed != ''
-        self.menu_set_idle_status_changed_event.state = self.config.event_idle_status_changed != ''
-        self.menu_set_charge_status_changed_event.state = self.config.event_charge_status_changed != ''
-        self.menu_set_sleep_waked_up_event.state = self.config.event_sleep_waked_up != ''
+        self.inject_config_menu_value()
+
+        # spawn pmset only if the setting is not known yet.
+        if self.pmset.get('disablesleep') is None:
+            self.pmset.refresh()
+        self.view.set(self.menu_disable_lid_sleep, state=self.pmset.get('disablesleep', False))
+
+    def inject_config_menu_value(self):
+        states = [
+            (self.menu_disable_idle_sleep_in_charging, self.config.disable_idle_sleep_in_charging),
+            (self.menu_disable_lid_sleep_in_charging, self.config.disable_lid_sleep_in_charging),
+            (self.menu_low_battery_capacity_sleep, self.config.low_battery_capacity_sleep),
+            (self.menu_screen_save_on_lid, self.config.screen_save_on_lid),
+            (self.menu_short_time_cancel_screen_save, self.config.short_time_cancel_screen_save),
+            (self.menu_set_lid_status_changed_event, self.config.event_lid_status_changed != ''),
+            (self.menu_set_idle_status_changed_event, self.config.event_idle_status_changed != ''),
+            (self.menu_set_charge_status_changed_event, self.config.event_charge_status_changed != ''),
+            (self.menu_set_sleep_waked_up_event, self.config.event_sleep_waked_up != ''),
+        ]
+        for menu, state in states:
+            self.view.set(menu, state=state)
+
+    def apply_config(self, changed: dict):
+        super().apply_config(changed)
+
+        # menu states only, no pmset spawn.
+        self.inject_config_menu_value()
+        if 'process_timeout' in changed:
+            self.admin_helper.timeout = self.config.process_timeout
+        if 'admin_helper' in changed:
+            self.admin_helper_failed = False
 
     def inject_menu_title(self):
         super().inject_menu_title()
@@ -155,7 +182,7 @@ class Application(ApplicationBase, ApplicationView):
         for i in self.menu_cat:
             item = self.menu[i['name']]  # type: dict
             menu = item['object']  # type: rumps.MenuItem
-            menu.title = self.lang.menu_ex_cancel_after_time % (self.time_convert(i['time']))
+            self.view.set(menu, title=self.lang.menu_ex_cancel_after_time % (self.time_convert(i['time'])))
 
     def init_menu(self):
         self.setup_menus()
@@ -171,8 +198,54 @@ class Application(ApplicationBase, ApplicationView):
         self.bind_menu_callback()
         self.inject_menu_title()
         self.inject_menu_value()
+        self.view.render()
+
+    def start_admin_helper(self):
+        if self.admin_helper_failed:
+            return False
+
+        if getattr(sys, 'frozen', False):
+            # packed app has no python interpreter, its executable run the helper script shipped as data.
+            [python, script] = [sys.executable, None]
+            path_script = '%s/app/util/admin_helper.py' % self.app_shell.get_runtime_dir()
+        else:
+            [python, script] = [common.python_path() or sys.executable, admin_helper.__file__]
+            path_script = script
+
+        command = None
+        if os.path.exists(path_script):
+            command = admin_helper.launch_command(python, self.admin_helper.path, os.getuid(), os.getpid(), script)
+        if command is None or not self.admin_exec_direct(command):
+            self.admin_helper_fail()
+            return False
+
+        @common.wait_and_check(3, 0.1)
+        def check_start():
+            return not self.admin_helper.ping()
+
+        check_start()
+        started = self.admin_helper.ping()
+        Log.append(self.start_admin_helper, 'Info', {'path': self.admin_helper.path, 'started': started})
+        if not started:
+            self.admin_helper_fail()
+        return started
+
+    def admin_helper_fail(self):
+        # don't launch again on every admin_exec, until restart or admin_helper config changed.
+        self.admin_helper_failed = True
+        Log.append(self.start_admin_helper, 'Warning', 'admin helper unavailable, use direct admin exec.')
 
     def admin_exec(self, command):
+        if self.config.admin_helper:
+            if self.admin_helper.ping() or self.start_admin_helper():
+                code, out, err = self.admin_helper.exec(command)
+                Log.append(self.admin_exec, 'Info', {'command': command, 'status': code, 'output': out, 'error': err},
+                           level='Debug')
+                return code == 0
+
+        return self.admin_exec_direct(command)
+
+    def admin_exec_direct(self, command):
         code = -1
 
         if self.config.username != '':
@@ -189,6 +262,12 @@ class Application(ApplicationBase, ApplicationView):
         return True
 
     def refresh_battery_status_view(self):
+        snapshot = (self.battery_status['percent'], self.battery_status['status'],
+                    self.battery_status['remaining'], self.lang)
+        if snapshot == self.battery_status_view:
+            return
+        self.battery_status_view = snapshot
+
         self.set_menu_title(
             'view_percent', self.lang.view_percent % self.battery_status['percent'])
 
@@ -203,30 +282,35 @@ class Application(ApplicationBase, ApplicationView):
 
     def refresh_sleep_idle_time(self):
         [info, note] = system_api.sleep_info()
+        self.pmset.update(info)
         if 'prevented' not in note.get('sleep', ''):
             self.sleep_idle_time = info.get('sleep', 0) * 60
         else:
             self.sleep_idle_time = -1
 
     def callback_refresh_view(self, sender: rumps.Timer):
-        self.refresh_battery_status_view()
+        if self.battery_status is not None:
+            self.refresh_battery_status_view()
 
         # cancel after time refresh.
         if self.cancel_disable_idle_sleep_time is not None:
             time_remain = self.cancel_disable_idle_sleep_time - time.time()
             if time_remain > 0:
-                self.menu_disable_idle_sleep.title = '%s - %s' % (
+                self.view.set(self.menu_disable_idle_sleep, title='%s - %s' % (
                     self.lang.menu_disable_idle_sleep, self.lang.menu_ex_cancel_after_time % (
                         self.time_convert(time_remain)
-                    ))
+                    )))
 
         if self.cancel_disable_lid_sleep_time is not None:
             time_remain = self.cancel_disable_lid_sleep_time - time.time()
             if time_remain > 0:
-                self.menu_disable_lid_sleep.title = '%s - %s' % (
+                self.view.set(self.menu_disable_lid_sleep, title='%s - %s' % (
                     self.lang.menu_disable_lid_sleep, self.lang.menu_ex_cancel_after_time % (
                         self.time_convert(time_remain)
-                    ))
+                    )))
+
+        # apply all changes of this tick (include from refresh thread) in one batch.
+        self.view.render()
 
     def callback_refresh(self):
         # check long time no refresh sleep.
@@ -234,9 +318,9 @@ class Application(ApplicationBase, ApplicationView):
         if self.refresh_time is not None:
             sleep_time = refresh_time - self.refresh_time
             if sleep_time >= Const.check_sleep_time:
-                idle_time = system_api.get_hid_idle_time()
+                [idle_time, probe_times] = self.probe(system_api.get_hid_idle_time)
                 if idle_time >= Const.check_sleep_time:
-                    self.callback_sleep_waked_up(sleep_time)
+                    self.callback_sleep_waked_up(sleep_time, probe_times=probe_times)
         self.refresh_time = refresh_time
 
         # cancel after time refresh.
@@ -253,36 +337,36 @@ class Application(ApplicationBase, ApplicationView):
         e_lid = self.config.event_lid_status_changed != ''
         e_idle = self.config.event_idle_status_changed != ''
 
-        if self.menu_disable_lid_sleep.state or e_lid or e_idle:
+        if self.view.state(self.menu_disable_lid_sleep) or e_lid or e_idle:
             # check lid status
             lid_stat_prev = self.lid_stat
-            self.lid_stat = system_api.check_lid()
+            [self.lid_stat, probe_times] = self.probe(system_api.check_lid)
             if self.lid_stat is not None:
                 if lid_stat_prev is None or lid_stat_prev != self.lid_stat:
-                    self.callback_lid_status_changed(self.lid_stat, lid_stat_prev)
+                    self.callback_lid_status_changed(self.lid_stat, lid_stat_prev, probe_times=probe_times)
 
             # check idle sleep (on disable (lid) sleep)
-            if not self.menu_disable_idle_sleep.state or e_idle:
+            if not self.view.state(self.menu_disable_idle_sleep) or e_idle:
                 self.refresh_sleep_idle_time()
                 if self.sleep_idle_time > 0 or e_idle:
-                    idle_time = system_api.get_hid_idle_time()
+                    [idle_time, probe_times] = self.probe(system_api.get_hid_idle_time)
                     if 0 < self.sleep_idle_time <= idle_time:
                         self.sleep()
                     if idle_time < self.idle_time:
                         if self.idle_time >= self.config.time_idle_event:
-                            self.callback_idle_status_changed(self.idle_time)
+                            self.callback_idle_status_changed(self.idle_time, probe_times=probe_times)
                     self.idle_time = idle_time
 
         # check battery status
         battery_status_prev = self.battery_status
-        self.battery_status = system_api.battery_status()
+        [self.battery_status, probe_times] = self.probe(system_api.battery_status)
         if self.battery_status is not None:
             if battery_status_prev is None:
-                self.callback_charge_status_changed(self.battery_status['status'])
+                self.callback_charge_status_changed(self.battery_status['status'], probe_times=probe_times)
             else:
                 if battery_status_prev['status'] != self.battery_status['status']:
                     self.callback_charge_status_changed(
-                        self.battery_status['status'], battery_status_prev['status'])
+                        self.battery_status['status'], battery_status_prev['status'], probe_times=probe_times)
 
             # low battery capacity sleep check
             if self.config.low_battery_capacity_sleep:
@@ -295,12 +379,13 @@ class Application(ApplicationBase, ApplicationView):
                     if low_battery_capacity or low_time_remaining:
                         self.sleep()
 
-    def callback_idle_status_changed(self, idle_time: float):
+    def callback_idle_status_changed(self, idle_time: float, probe_times: tuple = None):
         params = locals()
 
-        self.event_trigger(self.callback_idle_status_changed, params, self.config.event_idle_status_changed)
+        self.event_trigger(self.callback_idle_status_changed, params, self.config.event_idle_status_changed,
+                           probe_times)
 
-    def callback_sleep_waked_up(self, sleep_time: float):
+    def callback_sleep_waked_up(self, sleep_time: float, probe_times: tuple = None):
         params = locals()
 
         if time.time() - self.wake_time < Const.check_sleep_time:
@@ -308,9 +393,9 @@ class Application(ApplicationBase, ApplicationView):
         else:
             self.wake_time = time.time()
 
-        self.event_trigger(self.callback_sleep_waked_up, params, self.config.event_sleep_waked_up)
+        self.event_trigger(self.callback_sleep_waked_up, params, self.config.event_sleep_waked_up, probe_times)
 
-    def callback_lid_status_changed(self, status: bool, status_prev: bool = None):
+    def callback_lid_status_changed(self, status: bool, status_prev: bool = None, probe_times: tuple = None):
         params = locals()
 
         Log.append(self.callback_lid_status_changed, 'Info', 'from "%s" to "%s"' % (status_prev, status))
@@ -329,9 +414,10 @@ class Application(ApplicationBase, ApplicationView):
                 else:
                     osa_api.screen_save()
 
-        self.event_trigger(self.callback_lid_status_changed, params, self.config.event_lid_status_changed)
+        self.event_trigger(self.callback_lid_status_changed, params, self.config.event_lid_status_changed,
+                           probe_times)
 
-    def callback_charge_status_changed(self, status: str, status_prev: str = None):
+    def callback_charge_status_changed(self, status: str, status_prev: str = None, probe_times: tuple = None):
         params = locals()
 
         Log.append(self.callback_charge_status_changed, 'Info', 'from "%s" to "%s"' % (status_prev, status))
@@ -349,10 +435,11 @@ class Application(ApplicationBase, ApplicationView):
             if self.config.disable_lid_sleep_in_charging:
                 self.set_lid_sleep(False)
 
-        self.event_trigger(self.callback_charge_status_changed, params, self.config.event_charge_status_changed)
+        self.event_trigger(self.callback_charge_status_changed, params, self.config.event_charge_status_changed,
+                           probe_times)
 
     def set_sleep_mode(self, sender: rumps.MenuItem):
-        [info, _] = system_api.sleep_info()
+        info = self.pmset.refresh()
         items = [self.lang.sleep_mode_0, self.lang.sleep_mode_3, self.lang.sleep_mode_25]
         items_value = {
             0: 0,
@@ -362,17 +449,17 @@ class Application(ApplicationBase, ApplicationView):
 
         default = None
         for k, v in items_value.items():
-            if v == info['hibernatemode']:
+            if v == info.get('hibernatemode'):
                 default = k
-        res = osa_api.dialog_select(sender.title, self.lang.description_set_sleep_mode % info['hibernatemode'],
+        res = osa_api.dialog_select(sender.title, self.lang.description_set_sleep_mode % info.get('hibernatemode'),
                                     items, default)
         mode = items_value.get(res)
-        if mode is not None and mode != info['hibernatemode']:
-            system_api.set_sleep_mode(mode, self.admin_exec)
+        if mode is not None:
+            self.pmset.apply(hibernatemode=mode)
 
     def sleep(self):
-        fix_idle_sleep = self.menu_disable_idle_sleep.state
-        fix_lid_sleep = self.menu_disable_lid_sleep.state
+        fix_idle_sleep = self.view.state(self.menu_disable_idle_sleep)
+        fix_lid_sleep = self.view.state(self.menu_disable_lid_sleep)
 
         if fix_idle_sleep:
             self.set_idle_sleep(True)
@@ -413,26 +500,24 @@ class Application(ApplicationBase, ApplicationView):
         return is_real_sleep
 
     def set_lid_sleep(self, available):
-        self.menu_disable_lid_sleep.state = not available
+        self.view.set(self.menu_disable_lid_sleep, state=not available)
+        success = self.pmset.apply(disablesleep=0 if available else 1)
         if available:
-            success = system_api.set_sleep_available(True, self.admin_exec)
             self.cancel_disable_lid_sleep_time = None
-            self.menu_disable_lid_sleep.title = self.lang.menu_disable_lid_sleep
-        else:
-            success = system_api.set_sleep_available(False, self.admin_exec)
+            self.view.set(self.menu_disable_lid_sleep, title=self.lang.menu_disable_lid_sleep)
 
         if not success:
-            [info, _] = system_api.sleep_info()
-            self.menu_disable_lid_sleep.state = info.get('SleepDisabled', available)
+            # reconciler already read back the settings on failure.
+            self.view.set(self.menu_disable_lid_sleep, state=self.pmset.get('disablesleep', not available))
 
         return success
 
     def set_idle_sleep(self, available):
-        self.menu_disable_idle_sleep.state = not available
+        self.view.set(self.menu_disable_idle_sleep, state=not available)
         if available:
             self.pd_noidle.stop()
             self.cancel_disable_idle_sleep_time = None
-            self.menu_disable_idle_sleep.title = self.lang.menu_disable_idle_sleep
+            self.view.set(self.menu_disable_idle_sleep, title=self.lang.menu_disable_idle_sleep)
         else:
             self.pd_noidle.start()
 
@@ -460,9 +545,8 @@ class Application(ApplicationBase, ApplicationView):
 
     def quit(self):
         self.pd_noidle.stop()
-        [info, _] = system_api.sleep_info()
-        if info.get('SleepDisabled', False):
-            system_api.set_sleep_available(True, self.admin_exec)
+        self.pmset.refresh()
+        self.pmset.apply(disablesleep=0)
 
         super().quit()
 
@@ -502,6 +586,7 @@ class Application(ApplicationBase, ApplicationView):
         def t_refresh():
             try:
                 while True:
+                    self.reload_config()
                     self.callback_refresh()
                     time.sleep(1)
             except:
@@ -1,4 +1,5 @@
 import os
+import shlex
 import sys
 import threading
 import time
@@ -10,8 +11,19 @@ from app.res.const import Const
 from app.res.language import LANGUAGES, load_language
 from app.res.language.english import English
 from app.shell import init_app_shell
-from app.util import system_api, osa_api, github, object_convert
+from app.util import system_api, osa_api, github, object_convert, log_query
+from app.util.event_filter import EventFilters
+from app.util.event_journal import EventJournal
+from app.util.event_trace import EventTracer
+from app.util.diagnostic import DiagnosticBundle
+from app.util.hook_executor import HookExecutor
+from app.util.hook_plugin import PluginHooks
+from app.util.hook_worker import HookWorker
+from app.util.webhook import WebhookSink
 from app.util.log import Log
+from app.util.menu_view import MenuView
+from app.util.output_capture import BoundedCapture
+from app.util.process_limit import ProcessLimits
 
 
 class ApplicationBase:
@@ -34,10 +46,30 @@ class ApplicationBase:
 
         self.config = config_class()
         self.config.load()
+        Log.set_level(self.config.log_level)
+        Log.set_format(self.config.log_format)
+        Log.set_rotation(self.config.log_max_size * 1024 * 1024, self.config.log_max_age * 86400,
+                         self.config.log_keep, self.config.log_compress)
 
         self.lang = load_language(self.config.language)  # type: English
 
+        self.hook_executor = HookExecutor(self.config.hook_workers, self.config.hook_queue_size,
+                                          self.config.hook_queue_policy, self.config.hook_coalesce,
+                                          on_discard=self.hook_discarded)
+        self.plugin_hooks = PluginHooks()
+        self.hook_workers = {}
+        self.hook_limits = ProcessLimits(self.config.hook_nice, self.config.hook_io_throttle,
+                                         self.config.hook_cpu_limit, self.config.hook_memory_limit,
+                                         self.config.hook_nofile_limit)
+        self.webhook = None  # type: WebhookSink
+        self.journal = EventJournal(Log.path_journal)
+        self.tracer = EventTracer()
+        self.event_filters = EventFilters()
+        # resume spooled webhook batches.
+        self.get_webhook()
+
         self.menu = {}
+        self.view = MenuView()
         self.menu_check_update = None  # type: rumps.MenuItem
 
         self.is_admin = system_api.check_admin()
@@ -88,11 +120,7 @@ class ApplicationBase:
                     setattr(self, key, self.menu[k]['object'])
 
     def set_menu_title(self, name, title):
-        menu = self.app.menu[name]  # type: rumps.MenuItem
-        item = self.menu[id(menu)]
-        if item['title'] != title:
-            item['title'] = title
-            menu.title = title
+        self.view.set(self.menu[name]['object'], title=title)
 
     def set_menu_callback(self, key, callback=None):
         if not isinstance(key, str):
@@ -115,8 +143,9 @@ class ApplicationBase:
         """
 
         def switch(sender: rumps.MenuItem):
-            sender.state = not sender.state
-            setattr(self.config, key, bool(sender.state))
+            state = not self.view.state(sender)
+            self.config.set(key, state)
+            self.view.set(sender, state=state)
             self.config.save()
 
         return switch
@@ -135,10 +164,14 @@ class ApplicationBase:
                     content = convertor(content)
 
                 if content is not None:
-                    setattr(self.config, key, content)
+                    try:
+                        self.config.set(key, content)
+                    except ValueError as e:
+                        self.message_box(sender.title, self.lang.description_invalid_config % e)
+                        return False
 
                 if empty_state:
-                    sender.state = content != ''
+                    self.view.set(sender, state=content != '')
 
                 self.config.save()
                 return True
@@ -164,10 +197,14 @@ class ApplicationBase:
                 elif isinstance(options, list):
                     content = options[index]
 
-                setattr(self.config, key, content)
+                try:
+                    self.config.set(key, content)
+                except ValueError as e:
+                    self.message_box(sender.title, self.lang.description_invalid_config % e)
+                    return False
 
                 if empty_state:
-                    sender.state = content != ''
+                    self.view.set(sender, state=content != '')
 
                 self.config.save()
                 return True
@@ -185,15 +222,18 @@ class ApplicationBase:
 
     def inject_menu_title(self):
         for k, v in self.menu.items():
-            if isinstance(k, str) and 'menu_%s' % k in dir(self.lang):
-                title = getattr(self.lang, 'menu_%s' % k)
-                v['object'].title = title
+            if isinstance(k, str):
+                title = getattr(self.lang, 'menu_%s' % k, None)
+                if isinstance(title, str):
+                    self.view.set(v['object'], title=title)
 
     def callback_menu(self, name):
         try:
             Log.append(self.callback_menu, 'Info', 'Click %s.' % name)
             menu = self.menu[name]
             menu['callback'](menu['object'])
+            # menu callback on main thread, render its changes now.
+            self.view.render()
         except:
             self.callback_exception()
 
@@ -202,13 +242,16 @@ class ApplicationBase:
         if exc is None:
             exc = common.get_exception()
         Log.append(self.callback_exception, 'Error', exc)
+        Log.flush()
         if 'KeyboardInterrupt' in exc:
             self.quit()
         elif 'Too many open files in system' in exc:
             self.quit()
 
         if osa_api.alert(self.lang.title_crash, self.lang.description_crash):
-            self.export_log()
+            t = self.export_log(ask_window=False)
+            if t is not None:
+                t.join()
 
         if need_restart:
             self.restart()
@@ -234,9 +277,18 @@ class ApplicationBase:
         sys.excepthook = boom
 
     def quit(self):
+        self.config.flush()
+        for worker in self.hook_workers.values():
+            worker.stop()
+        if self.webhook is not None:
+            self.webhook.stop(timeout=self.config.process_timeout)
+        self.journal.stop(timeout=self.config.process_timeout)
+        Log.flush()
         rumps.quit_application()
 
     def restart(self, data=None):
+        # new process load config, write pending changes before it.
+        self.config.flush()
         path = self.app_shell.get_app_path()
         if path is not None:
             rd = common.dump_b64_data(data)
@@ -252,19 +304,82 @@ class ApplicationBase:
 
         self.quit()
 
-    def export_log(self):
+    def export_log(self, ask_window=True):
+        """
+        Export diagnostic bundle on background thread.
+        :return: export thread, or None if canceled.
+        """
         folder = osa_api.choose_folder(self.lang.menu_export_log)
-        if folder is not None:
-            log_str = Log.extract_log()
-            err_str = Log.extract_err()
-
-            if log_str != '':
-                with open('%s/%s' % (folder, '%s.log' % Const.app_name), 'w') as io:
-                    io.write(log_str)
+        if folder is None:
+            return None
+
+        start = None
+        if ask_window:
+            hours = osa_api.dialog_input(self.lang.menu_export_log, self.lang.description_export_log, '')
+            if hours is None:
+                return None
+            try:
+                start = time.time() - float(hours) * 3600 if hours.strip() != '' else None
+            except ValueError:
+                self.message_box(self.lang.menu_export_log, self.lang.description_invalid_config % hours)
+                return None
+
+        path = '%s/%s-%s.zip' % (folder, Const.app_name, time.strftime('%Y%m%d-%H%M%S'))
+        t = threading.Thread(target=self.export_diagnostic, args=(path, start))
+        t.start()
+        return t
+
+    def export_diagnostic(self, path, start=None, end=None):
+        menu = getattr(self, 'menu_export_log', None)  # type: rumps.MenuItem
+        title = self.lang.menu_export_log
+
+        def progress(done, total, name):
+            if menu is not None:
+                self.view.set(menu, title='%s %s' % (
+                    title, self.lang.noti_export_log_progress % (done * 100 // max(1, total))))
 
-            if err_str != '':
-                with open('%s/%s' % (folder, '%s.err' % Const.app_name), 'w') as io:
-                    io.write(err_str)
+        try:
+            bundle = DiagnosticBundle(path, start, end, progress)
+            bundle.export({
+                'config.json': self.config.to_dict,
+                'latency.json': self.tracer.export,
+                'traces.json': self.tracer.recent,
+                'stats.json': self.diagnostic_stats,
+            })
+            rumps.notification(self.lang.menu_export_log, '', self.lang.noti_export_log_done % path)
+        except:
+            Log.append_exception(self.export_diagnostic)
+        finally:
+            if menu is not None:
+                self.view.set(menu, title=title)
+
+    def diagnostic_stats(self):
+        return {
+            'version': Const.version,
+            'system': system_api.get_system_version(),
+            'uptime': time.time() - self.init_time,
+            'log': {'level': Log.level, 'dropped': Log.dropped, 'queue': len(Log.queue)},
+            'hook': {
+                'executor': self.hook_executor.metrics(),
+                'filters': self.event_filters.stats,
+                'workers': dict([(k, w.is_running) for k, w in self.hook_workers.items()]),
+            },
+            'journal': self.journal.stats,
+            'webhook': self.webhook.stats if self.webhook is not None else None,
+        }
+
+    def query_log(self, args: str):
+        """
+        Query log with log_query command line arguments, such as "--tag warning --since 3600",
+        and open the result on Console.app.
+        """
+        try:
+            Log.flush()
+            with open(Log.path_query, 'w') as io:
+                log_query.run([a for a in shlex.split(args) if a not in ['-f', '--follow']], io)
+            system_api.open_url('/System/Applications/Utilities/Console.app', p_args=(Log.path_query,), new=True)
+        except (ValueError, SystemExit):
+            self.message_box(self.lang.menu_export_log, common.get_exception())
 
     def set_language(self, language):
         self.lang = LANGUAGES[language]()
@@ -316,7 +431,7 @@ class ApplicationBase:
                     rumps.notification(self.lang.menu_check_update, self.lang.noti_update_none,
                                        self.lang.noti_update_star)
         except:
-            Log.append(self.check_update, 'Warning', common.get_exception())
+            Log.append_exception(self.check_update)
             if by_user:
                 rumps.notification(self.lang.menu_check_update, '', self.lang.noti_network_error)
 
@@ -339,6 +454,15 @@ class ApplicationBase:
             self.restart()
         elif res == ':debug':
             rumps.debug_mode(True)
+        elif isinstance(res, str) and res.startswith(':query log'):
+            threading.Thread(target=self.query_log, args=(res[len(':query log'):],)).start()
+        elif res == ':latency':
+            self.message_box(self.lang.menu_event_callback, self.tracer.summary())
+        elif res == ':hook stats':
+            self.message_box(self.lang.menu_event_callback, object_convert.to_json({
+                'executor': self.hook_executor.metrics(),
+                'filters': self.event_filters.stats,
+            }))
         elif res == Const.github_page.lower() and not welcome:
             system_api.open_url(Const.github_page)
         else:
@@ -359,20 +483,148 @@ class ApplicationBase:
             if osa_api.alert(sender.title, self.lang.description_clear_config_restart):
                 self.restart()
 
-    def event_trigger(self, source, params: dict, path_event: str):
-        if path_event != '':
-            params_pop = []
-            for k, v in params.items():
-                if type(v) not in [None.__class__, bool, int, float, str, list, dict]:
-                    params_pop.append(k)
-            for k in params_pop:
-                params.pop(k)
-
-            def t_event_execute():
-                [stat, out, err] = common.execute(
-                    path_event, env={Const.app_env: object_convert.to_json(params)}, sys_env=False,
-                    timeout=self.config.process_timeout, shell=True)
+    def reload_config(self):
+        """
+        Check config file change on refresh tick, apply changed fields without restart.
+        """
+        changed = self.config.reload()
+        if len(changed) > 0:
+            self.apply_config(changed)
+        return changed
+
+    def apply_config(self, changed: dict):
+        """
+        :param changed: field -> (old, new)
+        """
+        if 'log_level' in changed:
+            Log.set_level(self.config.log_level)
+        if 'log_format' in changed:
+            Log.set_format(self.config.log_format)
+        if len({'log_max_size', 'log_max_age', 'log_keep', 'log_compress'} & changed.keys()) > 0:
+            Log.set_rotation(self.config.log_max_size * 1024 * 1024, self.config.log_max_age * 86400,
+                             self.config.log_keep, self.config.log_compress)
+
+        if 'language' in changed:
+            self.lang = load_language(self.config.language)
+            self.inject_menu_title()
+
+        self.hook_executor.configure(self.config.hook_workers, self.config.hook_queue_size,
+                                     self.config.hook_queue_policy, self.config.hook_coalesce)
+
+        limit_fields = {'hook_nice', 'hook_io_throttle', 'hook_cpu_limit', 'hook_memory_limit', 'hook_nofile_limit'}
+        if len(limit_fields & changed.keys()) > 0:
+            self.hook_limits = ProcessLimits(self.config.hook_nice, self.config.hook_io_throttle,
+                                             self.config.hook_cpu_limit, self.config.hook_memory_limit,
+                                             self.config.hook_nofile_limit)
+        # stop hook workers with old limits or no longer in use, start again on next event.
+        commands = set([HookWorker.parse_command(v) for k, v in self.config.to_dict().items()
+                        if k.startswith('event_') and isinstance(v, str) and HookWorker.check(v)])
+        for command in list(self.hook_workers):
+            if command not in commands or len(limit_fields & changed.keys()) > 0:
+                self.hook_workers.pop(command).stop()
+
+        if 'event_webhook_url' in changed:
+            self.get_webhook()
+        if self.webhook is not None and 'event_webhook_batch_window' in changed:
+            self.webhook.batch_window = self.config.event_webhook_batch_window
+        if 'event_journal' in changed and not self.config.event_journal:
+            self.journal.stop(timeout=self.config.process_timeout)
+
+    def get_hook_worker(self, path_event: str) -> HookWorker:
+        command = HookWorker.parse_command(path_event)
+        worker = self.hook_workers.get(command)
+        if worker is None:
+            worker = self.hook_workers.setdefault(command, HookWorker(command, self.hook_limits))
+        return worker
+
+    def probe(self, func, *args, **kwargs):
+        """
+        Call probe function, measure its sample time for event latency tracing.
+        :return: result, monotonic (begin, end) time, pass it to event_trigger with the detected event.
+        """
+        begin = time.monotonic()
+        result = func(*args, **kwargs)
+        return result, (begin, time.monotonic())
+
+    def hook_discarded(self, key, payload, reason):
+        """
+        Hook executor coalesced or dropped queued task, finish its trace without hook stages.
+        """
+        [_, trace] = payload
+        self.tracer.discard(trace, reason)
+
+    def get_webhook(self):
+        url = self.config.event_webhook_url
+        if self.webhook is not None and self.webhook.url != url:
+            self.webhook.stop(timeout=self.config.process_timeout)
+            self.webhook = None
+        if self.webhook is None and url != '':
+            self.webhook = WebhookSink(url, self.config.event_webhook_batch_window,
+                                       timeout=self.config.process_timeout)
+        return self.webhook
+
+    def match_event_filter(self, event: str, params: dict):
+        expression = getattr(self.config, 'event_%s_filter' % event, '')
+        try:
+            return self.event_filters.match(event, expression, params)
+        except ValueError:
+            # invalid filter should not lose events.
+            Log.append_exception(self.match_event_filter)
+            return True
+
+    def event_trigger(self, source, params: dict, path_event: str, probe_times: tuple = None):
+        params.pop('probe_times', None)
+        params_pop = []
+        for k, v in params.items():
+            if type(v) not in [None.__class__, bool, int, float, str, list, dict]:
+                params_pop.append(k)
+        for k in params_pop:
+            params.pop(k)
+
+        event = source.__name__.replace('callback_', '', 1)
+        trace = EventTracer.new(event, *(probe_times or ()))
+
+        if self.config.event_journal:
+            self.journal.append(event, params)
+
+        webhook = self.get_webhook()
+        if webhook is not None:
+            webhook.put(event, params)
+
+        if path_event != '' and self.match_event_filter(event, params):
+            def event_execute(payload):
+                [params, trace] = payload
+                EventTracer.mark(trace, 'hook_start')
+                # hook raise (plugin load, spawn OSError) still finish its trace.
+                outcome = 'error'
+                try:
+                    if PluginHooks.check(path_event):
+                        [stat, out, err] = self.plugin_hooks.call(
+                            path_event, 'event_%s' % event, params, timeout=self.config.process_timeout)
+                    elif HookWorker.check(path_event):
+                        [stat, out, err] = self.get_hook_worker(path_event).send(
+                            event, params, timeout=self.config.process_timeout)
+                    else:
+                        spool_path = None
+                        if self.config.hook_output_spool:
+                            os.makedirs(Log.path_hook_output, exist_ok=True)
+                            BoundedCapture.prune(Log.path_hook_output)
+                            spool_path = '%s/%s_%d' % (Log.path_hook_output, event, time.time() * 1000)
+                        [stat, out, err] = common.execute_bounded(
+                            self.hook_limits.wrap(path_event), env={Const.app_env: object_convert.to_json(params)},
+                            sys_env=False,
+                            timeout=self.config.process_timeout, limit=self.config.hook_output_limit,
+                            spool_path=spool_path, shell=True, **self.hook_limits.popen_kwargs())
+                    outcome = 'done'
+                finally:
+                    EventTracer.mark(trace, 'hook_end')
+                    self.tracer.finish(trace, outcome)
                 Log.append(source, 'Event',
                            {'path': path_event, 'status': stat, 'output': out, 'error': err})
 
-            threading.Thread(target=t_event_execute).start()
+            EventTracer.mark(trace, 'enqueue')
+            if not self.hook_executor.submit(event, event_execute, (params, trace)):
+                self.tracer.discard(trace, 'dropped')
+                Log.append(source, 'Warning', 'event dropped by hook queue.', self.hook_executor.metrics())
+        else:
+            self.tracer.finish(trace)
@@ -1,40 +1,295 @@
 import base64
+import binascii
 import json
 import os
+import tempfile
+from collections import OrderedDict
+from operator import attrgetter
+from threading import Lock, Timer
 
+from app import common
 from app.res.const import Const
-from app.util import object_convert
 from app.util.log import Log
 
 
-class ConfigBase:
+def _protect(value: str):
+    return base64.b64encode(value.encode()).decode()[::-1]
+
+
+def _unprotect(value: str):
+    return base64.b64decode(value[::-1].encode()).decode()
+
+
+def _same(value):
+    return value
+
+
+class Field:
+    """
+    Config field schema, declare in config class body:
+        process_timeout = Field(5, minimum=1)
+    """
+    __slots__ = ('name', 'default', 'type', 'protected', 'options', 'minimum', 'maximum', 'dump', 'load_raw')
+
+    def __init__(self, default, type_=None, protected=False, options=None, minimum=None, maximum=None):
+        self.name = None
+        self.default = default
+        self.type = type_ if type_ is not None else type(default)
+        self.protected = protected
+        self.options = options
+        self.minimum = minimum
+        self.maximum = maximum
+        # serializers of config file value.
+        self.dump = _protect if protected else _same
+        self.load_raw = _unprotect if protected else _same
+
+    def validate(self, value):
+        """
+        :return: value of field type, raise ValueError if invalid.
+        """
+        if self.type is float and isinstance(value, int) and not isinstance(value, bool):
+            value = float(value)
+        if not isinstance(value, self.type) or (self.type is not bool and isinstance(value, bool)):
+            raise ValueError('%s: %r is not %s' % (self.name, value, self.type.__name__))
+        if self.options is not None and value not in self.options:
+            raise ValueError('%s: %r not in %r' % (self.name, value, self.options))
+        if self.minimum is not None and value < self.minimum:
+            raise ValueError('%s: %r < %r' % (self.name, value, self.minimum))
+        if self.maximum is not None and value > self.maximum:
+            raise ValueError('%s: %r > %r' % (self.name, value, self.maximum))
+        return value
+
+    def load(self, value):
+        try:
+            return self.validate(self.load_raw(value))
+        except (AttributeError, binascii.Error, UnicodeDecodeError):
+            raise ValueError('%s: invalid protected value' % self.name)
+
+
+class ConfigMeta(type):
+    """
+    Collect Field declarations into cls._fields, store values in __slots__.
+    """
+
+    def __new__(mcs, name, bases, namespace):
+        fields = OrderedDict()
+        for base in reversed(bases):
+            fields.update(getattr(base, '_fields', {}))
+
+        slots = []
+        for k, v in list(namespace.items()):
+            if isinstance(v, Field):
+                v.name = k
+                if k not in fields:
+                    slots.append(k)
+                fields[k] = v
+                del namespace[k]
+        namespace['__slots__'] = tuple(namespace.get('__slots__', ())) + tuple(slots)
+
+        cls = super().__new__(mcs, name, bases, namespace)
+        cls._fields = fields
+        cls._field_names = tuple(fields)
+        # tuple of all field values in one call.
+        getter = attrgetter(*fields) if len(fields) > 0 else (lambda obj: ())
+        cls._field_values = staticmethod(getter if len(fields) != 1 else (lambda obj: (getter(obj),)))
+        cls._protect_fields = [k for k, f in fields.items() if f.protected]
+        return cls
+
+
+class ConfigBase(metaclass=ConfigMeta):
+    __slots__ = ('_save_lock', '_save_timer', '_dirty', '_saved_content', '_saved_config', '_saved_stat')
+    _fields = OrderedDict()  # type: OrderedDict[str, Field]
     _config_name = ('com.%s.%s' % (Const.author, Const.app_name)).lower()
     _config_path = os.path.expanduser('~/Library/Application Support/%s' % _config_name)
-    _protect_fields = []
-    language = ''
+    # write-behind, saves in this window coalesce into one write. (unit: second)
+    _save_delay = 1.0
+    language = Field('')
+
+    def __init__(self):
+        for k, f in self._fields.items():
+            setattr(self, k, f.default)
+
+        self._save_lock = Lock()
+        self._save_timer = None  # type: Timer
+        self._dirty = False
+        self._saved_content = None
+        self._saved_config = {}
+        self._saved_stat = None
+
+    def _file_stat(self):
+        try:
+            stat = os.stat(self._config_path)
+            return stat.st_ino, stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def _apply(self, config: dict):
+        """
+        Set valid field values of config file dict.
+        :return: changed (field -> (old, new)), invalid messages
+        """
+        changed = {}
+        invalid = []
+        for k, f in self._fields.items():
+            if k in config:
+                try:
+                    value = f.load(config[k])
+                except ValueError as e:
+                    invalid.append(str(e))
+                    continue
+                old = getattr(self, k)
+                if old != value:
+                    setattr(self, k, value)
+                    changed[k] = (old, value)
+        return changed, invalid
 
     def load(self):
         try:
             if os.path.exists(self._config_path):
+                stat = self._file_stat()
+                with open(self._config_path, 'r') as io:
+                    content = io.read()
+                [_, invalid] = self._apply(json.loads(content))
+                self._update_replaces()
+                Log.append('config_load', 'Info', self.to_dict(redact=False))
+                if len(invalid) > 0:
+                    Log.append('config_load', 'Warning', 'invalid fields use default value.', invalid)
+                self._saved_content = content
+                self._saved_config = self.to_dict(redact=False)
+                self._saved_stat = stat
+        except:
+            self.save(delay=False)
+
+    def reload(self):
+        """
+        Reload config file if it changed on disk (inode, mtime or size), apply changed fields only.
+        :return: changed fields, field -> (old, new)
+        """
+        stat = self._file_stat()
+        if stat is None or stat == self._saved_stat:
+            return {}
+
+        with self._save_lock:
+            try:
                 with open(self._config_path, 'r') as io:
-                    config = json.load(io)
-                    for f in self._protect_fields:
-                        config[f] = base64.b64decode(config[f][::-1].encode()).decode()
-                    object_convert.dict_to_object(config, self, new_fields=False)
-                    Log.set_replaces(
-                        dict([(getattr(self, f), Const.protector) for f in self._protect_fields]))
-                    Log.append('config_load', 'Info', object_convert.object_to_dict(self))
+                    content = io.read()
+                config = json.loads(content)
+            except (OSError, ValueError):
+                # maybe writing by other program, retry on next check.
+                Log.append('config_reload', 'Debug', common.get_exception())
+                return {}
+
+            self._saved_stat = stat
+            if content == self._saved_content:
+                return {}
+            [changed, invalid] = self._apply(config)
+            self._saved_content = content
+            self._saved_config = self.to_dict(redact=False)
+
+        if len([k for k in changed if k in self._protect_fields]) > 0:
+            self._update_replaces()
+        Log.append('config_reload', 'Info', 'changed: %s' % ', '.join(sorted(changed)))
+        if len(invalid) > 0:
+            Log.append('config_reload', 'Warning', 'invalid fields are ignored.', invalid)
+        return changed
+
+    def _update_replaces(self):
+        Log.set_replaces(dict([(getattr(self, f), Const.protector) for f in self._protect_fields]))
+
+    def set(self, key, value):
+        """
+        Validate and set field value, raise ValueError if field unknown or value invalid.
+        """
+        f = self._fields.get(key)
+        if f is None:
+            raise ValueError('%s: unknown config field' % key)
+        value = f.validate(value)
+        setattr(self, key, value)
+        if f.protected:
+            self._update_replaces()
+        return value
+
+    def save(self, delay=True):
+        """
+        Mark config dirty, write it after save delay. Saves in the window coalesce into one write.
+        """
+        with self._save_lock:
+            self._dirty = True
+        if not delay:
+            self.flush()
+            return
+
+        with self._save_lock:
+            if self._save_timer is None:
+                self._save_timer = Timer(self._save_delay, self.flush)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+    def flush(self):
+        """
+        Write pending config now. Skip if not dirty or serialized content is unchanged.
+        """
+        with self._save_lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            if not self._dirty:
+                return False
+            self._dirty = False
+
+            config = self.to_dict(redact=False)
+            data = dict([(k, f.dump(config[k])) for k, f in self._fields.items()])
+            content = json.dumps(data, indent='  ', sort_keys=True)
+            if content == self._saved_content:
+                return False
+
+            self._write_atomic(content)
+            self._saved_stat = self._file_stat()
+            changed = sorted([k for k, v in config.items() if self._saved_config.get(k) != v])
+            self._saved_content = content
+            self._saved_config = config
+
+        Log.append('config_save', 'Info', 'changed: %s' % ', '.join(changed))
+        Log.append('config_save', 'Debug', config)
+        return True
+
+    def _write_atomic(self, content: str):
+        """
+        Write temp file in the same directory, fsync, then rename over the config file.
+        """
+        path_dir = os.path.dirname(self._config_path)
+        [fd, path_tmp] = tempfile.mkstemp(prefix='.%s.' % self._config_name, dir=path_dir)
+        try:
+            with os.fdopen(fd, 'w') as io:
+                io.write(content)
+                io.flush()
+                os.fsync(io.fileno())
+            os.replace(path_tmp, self._config_path)
         except:
-            self.save()
+            os.unlink(path_tmp)
+            raise
 
-    def save(self):
-        with open(self._config_path, 'w') as io:
-            config = object_convert.object_to_dict(self)
+        fd_dir = os.open(path_dir, os.O_RDONLY)
+        try:
+            os.fsync(fd_dir)
+        finally:
+            os.close(fd_dir)
+
+    def to_dict(self, redact=True):
+        config = dict(zip(self._field_names, self._field_values(self)))
+        if redact:
             for f in self._protect_fields:
-                config[f] = base64.b64encode(config[f].encode()).decode()[::-1]
-            json.dump(config, io, indent='  ')
-            Log.append('config_save', 'Info', object_convert.object_to_dict(self))
+                config[f] = Const.protector
+        return config
 
     def clear(self):
-        if os.path.exists(self._config_path):
-            os.unlink(self._config_path)
+        with self._save_lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            self._dirty = False
+            self._saved_content = None
+            self._saved_config = {}
+            self._saved_stat = None
+            if os.path.exists(self._config_path):
+                os.unlink(self._config_path)
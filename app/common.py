@@ -5,27 +5,123 @@ import sys
 import time
 import traceback
 from io import StringIO
-from subprocess import PIPE, Popen, TimeoutExpired
+from subprocess import PIPE, DEVNULL, Popen, TimeoutExpired
+from threading import Thread
 
+from app.util.output_capture import BoundedCapture
+from app.util.process_limit import kill_group
 
-def popen(cmd, sys_env=True, **kwargs):
+_base_env = None
+
+
+def base_env():
+    """
+    Cached copy of system environment, avoid copy os.environ on every spawn.
+    """
+    global _base_env
+    if _base_env is None:
+        _base_env = os.environ.copy()
+    return _base_env
+
+
+def popen(cmd, sys_env=True, stdin=True, stdout=True, stderr=True, text=True, **kwargs):
+    """
+    :param stdin, stdout, stderr: True for pipe, False for discard (devnull).
+    :param text: decode pipes as utf-8, or bytes mode.
+    """
     if sys_env and kwargs.get('env') is not None:
-        kwargs['env'] = os.environ.copy().update(kwargs['env'])
-    return Popen(cmd, stdin=PIPE, stdout=PIPE, stderr=PIPE, encoding='utf-8', **kwargs)
+        env = base_env().copy()
+        env.update(kwargs['env'])
+        kwargs['env'] = env
+
+    pipe = lambda x: PIPE if x else DEVNULL
+    return Popen(cmd, stdin=pipe(stdin), stdout=pipe(stdout), stderr=pipe(stderr),
+                 encoding='utf-8' if text else None, **kwargs)
 
 
 def execute(cmd, input_str=None, timeout=None, **kwargs):
-    p = popen(cmd, **kwargs)
+    """
+    :return: stat, out, err (None on discarded stream)
+    """
+    if input_str is None and kwargs.get('stdout') is False and kwargs.get('stderr') is False \
+            and not kwargs.get('start_new_session'):
+        # lean no-pipe mode, python fds are non-inheritable (PEP 446),
+        # skip close_fds let subprocess use posix_spawn. Hooks and daemons keep closing fds.
+        kwargs.setdefault('close_fds', False)
+    p = popen(cmd, stdin=input_str is not None, **kwargs)
     try:
         out, err = p.communicate(input_str, timeout=timeout)
     except TimeoutExpired:
         out = ''
         err = get_exception()
-        p.kill()
+        _kill(p, kwargs)
     stat = p.returncode
     return stat, out, err
 
 
+def execute_bounded(cmd, input_str=None, timeout=None, limit=64 * 1024, spool_path=None, **kwargs):
+    """
+    Execute with streaming capture, keep the head and the tail of output in bounded memory.
+    :param spool_path: output beyond the limit spool to "<spool_path>.out" / "<spool_path>.err".
+    :return: stat, out, err
+    """
+    p = popen(cmd, stdin=input_str is not None, text=False, **kwargs)
+    captures = [
+        BoundedCapture(limit, '%s.out' % spool_path if spool_path is not None else None),
+        BoundedCapture(limit, '%s.err' % spool_path if spool_path is not None else None),
+    ]
+
+    def read(io, capture: BoundedCapture):
+        with io:
+            for data in iter(lambda: io.read1(8192), b''):
+                capture.write(data)
+        capture.close()
+
+    threads = [Thread(target=read, args=(p.stdout, captures[0]), daemon=True),
+               Thread(target=read, args=(p.stderr, captures[1]), daemon=True)]
+    for t in threads:
+        t.start()
+
+    timeout_err = ''
+    try:
+        if input_str is not None:
+            try:
+                p.stdin.write(input_str.encode())
+                p.stdin.close()
+            except BrokenPipeError:
+                pass
+        p.wait(timeout)
+    except TimeoutExpired:
+        timeout_err = get_exception()
+        _kill(p, kwargs)
+
+    for t in threads:
+        # after kill, don't wait for pipes held by escaped grandchildren forever.
+        t.join(1 if timeout_err != '' else None)
+    # reader still alive after join stop writing into captures.
+    for c in captures:
+        c.close()
+
+    [out, err] = [c.getvalue() for c in captures]
+    return p.returncode, out, timeout_err + err
+
+
+def _kill(p: Popen, kwargs: dict):
+    if kwargs.get('start_new_session'):
+        # kill whole process group, include grandchildren.
+        kill_group(p)
+    else:
+        p.kill()
+    p.wait()
+
+
+def execute_discard(cmd, timeout=None, **kwargs):
+    """
+    Execute without any pipe, for fire-and-forget commands.
+    """
+    return execute(cmd, timeout=timeout, stdout=False, stderr=False, **kwargs)
+
+
 def execute_get_out(cmd, **kwargs):
     [_, out, _] = execute(cmd, **kwargs)
     return out
@@ -1,24 +1,46 @@
-from .base.config import ConfigBase
+from .base.config import ConfigBase, Field
 
 
 class Config(ConfigBase):
-    _protect_fields = [
-        'password',
-    ]
-    welcome = True
-    username = ''
-    password = ''
-    language = 'en'
-    low_battery_capacity_sleep = True
-    low_battery_capacity = 6
-    low_time_remaining = 10
-    disable_idle_sleep_in_charging = False
-    disable_lid_sleep_in_charging = False
-    screen_save_on_lid = False
-    short_time_cancel_screen_save = True
-    event_idle_status_changed = ''
-    event_lid_status_changed = ''
-    event_charge_status_changed = ''
-    event_sleep_waked_up = ''
-    time_idle_event = 30
-    process_timeout = 5
+    welcome = Field(True)
+    username = Field('')
+    password = Field('', protected=True)
+    language = Field('en')
+    low_battery_capacity_sleep = Field(True)
+    low_battery_capacity = Field(6, minimum=0, maximum=100)
+    low_time_remaining = Field(10, minimum=0)
+    disable_idle_sleep_in_charging = Field(False)
+    disable_lid_sleep_in_charging = Field(False)
+    screen_save_on_lid = Field(False)
+    short_time_cancel_screen_save = Field(True)
+    event_idle_status_changed = Field('')
+    event_lid_status_changed = Field('')
+    event_charge_status_changed = Field('')
+    event_sleep_waked_up = Field('')
+    event_idle_status_changed_filter = Field('')
+    event_lid_status_changed_filter = Field('')
+    event_charge_status_changed_filter = Field('')
+    event_sleep_waked_up_filter = Field('')
+    time_idle_event = Field(30, minimum=1)
+    process_timeout = Field(5, minimum=1)
+    log_level = Field('Info', options=['Debug', 'Info', 'Warning', 'Error'])
+    log_format = Field('text', options=['text', 'both'])
+    log_max_size = Field(10, minimum=0)
+    log_max_age = Field(7, minimum=0)
+    log_keep = Field(5, minimum=1)
+    log_compress = Field(True)
+    admin_helper = Field(False)
+    hook_workers = Field(2, minimum=1)
+    hook_queue_size = Field(16, minimum=1)
+    hook_queue_policy = Field('drop_oldest', options=['drop_oldest', 'drop_new'])
+    hook_coalesce = Field(True)
+    hook_nice = Field(10, minimum=0, maximum=20)
+    hook_io_throttle = Field(True)
+    hook_cpu_limit = Field(0, minimum=0)
+    hook_memory_limit = Field(0, minimum=0)
+    hook_nofile_limit = Field(1024, minimum=0)
+    hook_output_limit = Field(64 * 1024, minimum=1024)
+    hook_output_spool = Field(False)
+    event_webhook_url = Field('')
+    event_webhook_batch_window = Field(0.5, minimum=0)
+    event_journal = Field(True)
@@ -9,3 +9,4 @@ class Const:
     time_options = [300, 600, 1800, '-', 3600, 7200, 10800, '-', 43200, 86400]
     check_sleep_time = 30
     sleep_ready_time_limit = 3600
+    admin_helper_socket = '/var/run/%s.%%d.sock' % app_name.lower()
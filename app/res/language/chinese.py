@@ -55,6 +55,8 @@ class Chinese(English):
 当前模式：%s'''
     description_set_event = '''在此输入可执行程序的路径。如果该事件被触发，将会执行这个程序。
 事件参数将通过环境变量进行传递。（JSON 格式, 键值: %s）
+或者输入 “py:” 加上 Python 文件路径，该文件只会被导入一次，并直接调用其中的 “event_*” 函数。
+或者输入 “worker:” 加上程序路径，该程序将保持运行，并通过标准输入以 JSON 行接收事件。
 
 有关更多信息，请访问 GitHub 页面下的 “doc/” 目录。（例如使用样例）''' % Const.app_env
     description_welcome_why_need_admin = '''您需要输入管理员帐户以授予SleeperX权限。因为SleeperX会更改“电源管理设置”。（阻止合盖睡眠）'''
@@ -68,6 +70,8 @@ Enjoy yourself!''' % Const.app_name
 如果管理帐户是正确的，但始终无法使用，您可以尝试导出日志（在“偏好设置”-“高级选项”），并发送到这个项目的 issues 页面。'''
     description_clear_config = '''这将会删除配置文件，确定吗？'''
     description_clear_config_restart = '''配置文件已经被删除，现在重新启动该应用？'''
+    description_export_log = '''导出最近若干小时的日志记录到诊断包。 (单位: 小时)
+留空则导出全部。'''
 
     menu_sleep_now = '立即睡眠'
     menu_display_sleep_now = '立即关闭显示器'
@@ -116,6 +120,9 @@ Enjoy yourself!''' % Const.app_name
     noti_update_none = '当前已是最新版本。'
     noti_update_star = '（如果你喜欢这个应用，请在GitHub给我个star，thanks。）'
     noti_network_error = '网络出现问题，请稍后重试。'
+    noti_export_log_progress = '正在导出... (%d%%)'
+    noti_export_log_done = '诊断包已导出: %s'
+    description_invalid_config = '无效的值，未保存。\n%s'
 
     sleep_mode_0 = '模式0'
     sleep_mode_3 = '模式3'
@@ -56,6 +56,8 @@ If you want "hibernation" - slower sleeps, slower wakes, and better battery life
 Current Mode: %s'''
     description_set_event = '''Input executable program path on here. If this event triggered, will execute this program.
 Event parameter will passing through Environment. (JSON Format, key: %s)
+Or input "py:" with a python file path, it will be imported once and call its "event_*" function directly.
+Or input "worker:" with a program, it will be kept running and receive events as JSON lines on stdin.
 
 More information can found on GitHub "doc/" folder. (such as examples.)''' % Const.app_env
     description_welcome_why_need_admin = '''You need to input your administrator account to grant privileges for SleeperX. Because SleeperX will change "Power Management Settings". (Disable Lid Sleep)'''
@@ -69,6 +71,8 @@ Please check your admin account (username and password) is correct.
 If admin account is correct, But always can't do this, You can try to export log (in "Preferences" - "Advanced Options"), and send to this project issues page.'''
     description_clear_config = '''This action will delete config file, Do it now?'''
     description_clear_config_restart = '''Config file is deleted now, Restart this application now?'''
+    description_export_log = '''Export log records of recent hours into a diagnostic bundle. (unit: hour)
+Leave empty to export all.'''
 
     menu_sleep_now = 'Sleep Now'
     menu_display_sleep_now = 'Display Sleep Now'
@@ -117,6 +121,9 @@ If admin account is correct, But always can't do this, You can try to export log
     noti_update_none = 'Current is the newest version.'
     noti_update_star = '(If you love this app, give me a star on GitHub, thanks.)'
     noti_network_error = 'The network maybe have some problem, please retry later.'
+    noti_export_log_progress = 'Exporting... (%d%%)'
+    noti_export_log_done = 'Diagnostic bundle exported: %s'
+    description_invalid_config = 'Invalid value, not saved.\n%s'
 
     sleep_mode_0 = 'mode 0'
     sleep_mode_3 = 'mode 3'
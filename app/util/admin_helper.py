@@ -0,0 +1,261 @@
+"""
+Long-lived privileged helper, serve allow-listed pmset commands over a unix domain socket.
+This module only depend on standard library, it can run standalone as root:
+    python3 admin_helper.py --socket /var/run/x.sock --uid 501 --ppid 1234 --daemon
+Use `--pmset /bin/echo` as an unprivileged stand-in for test.
+"""
+import json
+import os
+import shlex
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+PMSET_PATH = '/usr/bin/pmset'
+# pmset setting -> allowed values.
+ALLOW_SETTINGS = {
+    'disablesleep': ['0', '1'],
+    'hibernatemode': ['0', '3', '25'],
+}
+ALLOW_ACTIONS = ['sleepnow', 'displaysleepnow']
+# first argument of frozen app executable, run the helper script shipped as data file instead of the app.
+FROZEN_ARG = '--admin-helper'
+
+
+def check_command(args: list):
+    if len(args) < 2 or args[0] != PMSET_PATH:
+        return False
+
+    params = args[1:]
+    if len(params) == 1:
+        return params[0] in ALLOW_ACTIONS
+
+    if params[0] == '-a':
+        params = params[1:]
+    if len(params) == 0 or len(params) % 2 != 0:
+        return False
+    for i in range(0, len(params), 2):
+        if params[i + 1] not in ALLOW_SETTINGS.get(params[i], []):
+            return False
+
+    return True
+
+
+def peer_uid(conn: socket.socket):
+    try:
+        if hasattr(socket, 'SO_PEERCRED'):
+            # linux: struct ucred {pid_t pid; uid_t uid; gid_t gid;}
+            cred = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+            return struct.unpack('3i', cred)[1]
+        else:
+            # macOS: SOL_LOCAL = 0, LOCAL_PEERCRED = 1, struct xucred {u_int cr_version; uid_t cr_uid; ...}
+            cred = conn.getsockopt(0, 1, struct.calcsize('2I') + 2 + 4 * 16 + 2)
+            return struct.unpack('2I', cred[:8])[1]
+    except OSError:
+        return None
+
+
+class AdminHelperServer:
+    def __init__(self, path, uid=None, ppid=None, pmset_path=PMSET_PATH, timeout=None):
+        self.path = path
+        self.uid = uid
+        self.ppid = ppid
+        self.pmset_path = pmset_path
+        self.timeout = timeout
+        self._sock = None  # type: socket.socket
+        self._running = False
+        # inode of bound socket file, never unlink the socket of another helper.
+        self._inode = None
+
+    def execute(self, command: str):
+        try:
+            args = shlex.split(command)
+        except ValueError:
+            args = []
+
+        if not check_command(args):
+            return {'status': -1, 'output': '', 'error': 'command not allowed: %s' % command}
+
+        args[0] = self.pmset_path
+        try:
+            p = subprocess.run(args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               encoding='utf-8', timeout=self.timeout)
+            return {'status': p.returncode, 'output': p.stdout, 'error': p.stderr}
+        except (OSError, subprocess.TimeoutExpired) as e:
+            return {'status': -1, 'output': '', 'error': str(e)}
+
+    def handle(self, conn: socket.socket):
+        with conn, conn.makefile('rw', encoding='utf-8') as io:
+            uid = peer_uid(conn)
+            # unknown peer is rejected too.
+            if self.uid is not None and (uid is None or uid not in [0, self.uid]):
+                return
+
+            for line in io:
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    break
+
+                command = request.get('command')
+                if command is None:
+                    response = {'status': 0, 'output': 'pong', 'error': ''}
+                else:
+                    response = self.execute(command)
+                io.write('%s\n' % json.dumps(response))
+                io.flush()
+
+    def _watch_parent(self):
+        while self._running:
+            try:
+                os.kill(self.ppid, 0)
+            except ProcessLookupError:
+                self.stop()
+            except PermissionError:
+                pass
+            time.sleep(3)
+
+    def serve(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        self._inode = os.stat(self.path).st_ino
+        os.chmod(self.path, 0o600)
+        if self.uid is not None and os.getuid() == 0:
+            os.chown(self.path, self.uid, -1)
+        self._sock.listen(4)
+        self._running = True
+
+        if self.ppid is not None:
+            threading.Thread(target=self._watch_parent, daemon=True).start()
+
+        try:
+            while self._running:
+                try:
+                    conn, _ = self._sock.accept()
+                except OSError:
+                    break
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._running = False
+        if self._sock is not None:
+            # close only does not unblock accept() on linux.
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._sock.close()
+        try:
+            if self._inode is not None and os.stat(self.path).st_ino == self._inode:
+                os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class AdminHelperClient:
+    def __init__(self, path, timeout=None):
+        self.path = path
+        self.timeout = timeout
+        self._sock = None  # type: socket.socket
+        self._io = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(self.timeout)
+        self._sock.connect(self.path)
+        self._io = self._sock.makefile('rw', encoding='utf-8')
+
+    def close(self):
+        # connect may fail before makefile.
+        if self._io is not None:
+            self._io.close()
+        if self._sock is not None:
+            self._sock.close()
+        self._sock = None
+        self._io = None
+
+    def request(self, data: dict):
+        with self._lock:
+            # reconnect once, the helper may be restarted.
+            for retry in [True, False]:
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    self._io.write('%s\n' % json.dumps(data))
+                    self._io.flush()
+                    line = self._io.readline()
+                    if line == '':
+                        raise ConnectionError('helper closed connection.')
+                    return json.loads(line)
+                except (OSError, ValueError):
+                    self.close()
+                    if not retry:
+                        raise
+
+    def ping(self):
+        try:
+            return self.request({}).get('output') == 'pong'
+        except (OSError, ValueError):
+            return False
+
+    def exec(self, command: str):
+        try:
+            res = self.request({'command': command})
+            return res['status'], res['output'], res['error']
+        except (OSError, ValueError) as e:
+            return -1, '', str(e)
+
+
+def launch_command(python, path, uid, ppid, script=None):
+    """
+    :param python: python interpreter, or frozen app executable which run the helper by FROZEN_ARG (script None).
+    :param script: helper script path, default this module file.
+    """
+    if script is None and getattr(sys, 'frozen', False):
+        args = [python, FROZEN_ARG]
+    else:
+        args = [python, os.path.abspath(script if script is not None else __file__)]
+    return '%s --socket %s --uid %d --ppid %d --daemon' % (
+        ' '.join([shlex.quote(a) for a in args]), shlex.quote(path), uid, ppid)
+
+
+def daemonize():
+    if os.fork() > 0:
+        os._exit(0)
+    os.setsid()
+    fd = os.open(os.devnull, os.O_RDWR)
+    for i in range(3):
+        os.dup2(fd, i)
+    os.close(fd)
+
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description='privileged pmset helper.')
+    parser.add_argument('--socket', required=True)
+    parser.add_argument('--uid', type=int)
+    parser.add_argument('--ppid', type=int)
+    parser.add_argument('--pmset', default=PMSET_PATH)
+    parser.add_argument('--timeout', type=float)
+    parser.add_argument('--daemon', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.daemon:
+        daemonize()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    AdminHelperServer(args.socket, args.uid, args.ppid, args.pmset, args.timeout).serve()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
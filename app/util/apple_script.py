@@ -49,5 +49,5 @@ class AppleScript:
     @staticmethod
     def exec(code: str, timeout=None):
         stat, out, err = common.execute('/usr/bin/osascript', code, timeout)
-        Log.append(AppleScript.exec, 'AppleScript', locals())
+        Log.append(AppleScript.exec, 'AppleScript', locals(), level='Debug')
         return stat, out, err
@@ -0,0 +1,146 @@
+import gzip
+import json
+import os
+import shutil
+import zipfile
+
+from app.util import object_convert
+from app.util.event_journal import EventJournal
+from app.util.log import Log
+from app.util.log_query import LogQuery
+from app.util.log_ring import LogRing
+
+
+class DiagnosticBundle:
+    """
+    Stream logs, events and runtime information into one compressed zip archive.
+    Every entry is written chunk by chunk, memory usage does not depend on log size.
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, path, start=None, end=None, progress=None):
+        """
+        :param start, end: optional epoch time window of log and event records.
+        :param progress: callback(done: int, total: int, name: str)
+        """
+        self.path = path
+        self.start = start
+        self.end = end
+        self.progress = progress
+
+    def _open(self, zf: zipfile.ZipFile, name):
+        return zf.open(name, 'w', force_zip64=True)
+
+    def _copy(self, zf, name, io_src):
+        with self._open(zf, name) as io_dest:
+            shutil.copyfileobj(io_src, io_dest, self.chunk_size)
+
+    def _write_lines(self, zf, name, lines):
+        """
+        Write iterator of str, buffered into chunks.
+        """
+        with self._open(zf, name) as io_dest:
+            buffer = []
+            size = 0
+            for line in lines:
+                buffer.append(line)
+                size += len(line)
+                if size >= self.chunk_size:
+                    io_dest.write(''.join(buffer).encode())
+                    buffer = []
+                    size = 0
+            io_dest.write(''.join(buffer).encode())
+
+    def _add_raw(self, zf, name, path):
+        if path.endswith('.gz'):
+            with gzip.open(path, 'rb') as io:
+                self._copy(zf, name, io)
+        else:
+            with open(path, 'rb') as io:
+                self._copy(zf, name, io)
+
+    def _add_log(self, zf, name, path):
+        if self.start is None and self.end is None:
+            self._add_raw(zf, name, path)
+        else:
+            # only the current log file entry, records of all segments in time window.
+            self._write_lines(zf, name, LogQuery(path).query(self.start, self.end))
+
+    def _json_records(self, paths):
+        for path in paths:
+            with (gzip.open if path.endswith('.gz') else open)(path, 'rt', errors='replace') as io:
+                for line in io:
+                    try:
+                        t = json.loads(line).get('time')
+                    except (ValueError, AttributeError):
+                        continue
+                    if not isinstance(t, (int, float)):
+                        continue
+                    if (self.start is None or t >= self.start) and (self.end is None or t <= self.end):
+                        yield line
+
+    def _add_json_log(self, zf, name, path):
+        if self.start is None and self.end is None:
+            self._add_raw(zf, name, path)
+        else:
+            # like _add_log, records of all segments in time window.
+            self._write_lines(zf, name, self._json_records(list(reversed(Log.rotated_paths(path))) + [path]))
+
+    def _add_err(self, zf, name, path):
+        # stderr is not written by Log, redact it when export.
+        with open(path, 'r', errors='replace') as io:
+            self._write_lines(zf, name, (Log.redact(line) for line in io))
+
+    def _add_events(self, zf, name, path_dir):
+        records = EventJournal.read(path_dir, self.start, self.end)
+        self._write_lines(zf, name, ('%s\n' % object_convert.to_json_line(r) for r in records))
+
+    def _add_json(self, zf, name, obj):
+        if callable(obj):
+            obj = obj()
+        self._write_lines(zf, name, [Log.redact(object_convert.to_json(obj))])
+
+    def export(self, items: dict = None):
+        """
+        :param items: extra json entries, name -> object or function return object.
+        """
+        Log.flush()
+        tasks = []
+        if self.start is None and self.end is None:
+            for path in reversed(Log.rotated_paths(Log.path_log)):
+                name = os.path.basename(path)
+                tasks.append((name[:-len('.gz')] if name.endswith('.gz') else name, self._add_log, path))
+        if isinstance(Log.io_log, LogRing):
+            # without file logging, records only in memory.
+            tasks.append(('%s.memory.log' % os.path.splitext(os.path.basename(Log.path_log))[0],
+                          self._write_lines, [Log.io_log.getvalue()]))
+        elif os.path.exists(Log.path_log):
+            tasks.append((os.path.basename(Log.path_log), self._add_log, Log.path_log))
+        if os.path.exists(Log.path_json):
+            if self.start is None and self.end is None:
+                for path in reversed(Log.rotated_paths(Log.path_json)):
+                    name = os.path.basename(path)
+                    tasks.append((name[:-len('.gz')] if name.endswith('.gz') else name, self._add_raw, path))
+            tasks.append((os.path.basename(Log.path_json), self._add_json_log, Log.path_json))
+        if os.path.exists(Log.path_err):
+            tasks.append((os.path.basename(Log.path_err), self._add_err, Log.path_err))
+        if len(EventJournal.segment_seqs(Log.path_journal)) > 0:
+            tasks.append(('events.jsonl', self._add_events, Log.path_journal))
+
+        for name, obj in (items or {}).items():
+            tasks.append((name, self._add_json, obj))
+
+        path_tmp = '%s.tmp' % self.path
+        with zipfile.ZipFile(path_tmp, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for i, [name, func, arg] in enumerate(tasks):
+                if self.progress is not None:
+                    self.progress(i, len(tasks), name)
+                try:
+                    func(zf, name, arg)
+                except (OSError, ValueError):
+                    Log.append_exception(self.export)
+        os.replace(path_tmp, self.path)
+
+        if self.progress is not None:
+            self.progress(len(tasks), len(tasks), '')
+        return self.path
@@ -0,0 +1,154 @@
+import re
+from threading import Lock
+
+
+class EventFilter:
+    """
+    Compile filter expression on event params once, evaluate in-process.
+    example: status_prev == true and status == false
+             idle_time >= 300 or (status == "charging" and not status_prev)
+    """
+    reg_token = re.compile(r'''\s*(?:(?P<number>-?\d+(?:\.\d+)?)|(?P<string>"[^"]*"|'[^']*')|(?P<op>==|!=|<=|>=|<|>)|'''
+                           r'''(?P<paren>[()])|(?P<name>[A-Za-z_][A-Za-z0-9_]*))''')
+    constants = {'true': True, 'false': False, 'null': None, 'none': None}
+    operators = {
+        '==': lambda a, b: a == b,
+        '!=': lambda a, b: a != b,
+        '<': lambda a, b: a < b,
+        '<=': lambda a, b: a <= b,
+        '>': lambda a, b: a > b,
+        '>=': lambda a, b: a >= b,
+    }
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self._tokens = self._tokenize(expression)
+        self._pos = 0
+        self._func = self._parse_or()
+        if self._pos < len(self._tokens):
+            raise ValueError('unexpected token "%s" in filter: %s' % (self._tokens[self._pos][1], expression))
+        self._tokens = None
+
+    def __call__(self, params: dict):
+        return bool(self._func(params))
+
+    def _tokenize(self, expression):
+        tokens = []
+        pos = 0
+        expression = expression.rstrip()
+        while pos < len(expression):
+            match = self.reg_token.match(expression, pos)
+            if match is None or match.end() == pos:
+                raise ValueError('invalid filter at %d: %s' % (pos, expression))
+            kind = match.lastgroup
+            tokens.append((kind, match.group(kind)))
+            pos = match.end()
+        return tokens
+
+    def _peek(self):
+        if self._pos < len(self._tokens):
+            return self._tokens[self._pos]
+        return None, None
+
+    def _take(self):
+        token = self._peek()
+        self._pos += 1
+        return token
+
+    def _is_keyword(self, keyword):
+        kind, value = self._peek()
+        return kind == 'name' and value.lower() == keyword
+
+    def _parse_or(self):
+        funcs = [self._parse_and()]
+        while self._is_keyword('or'):
+            self._take()
+            funcs.append(self._parse_and())
+        if len(funcs) == 1:
+            return funcs[0]
+        return lambda p: any(f(p) for f in funcs)
+
+    def _parse_and(self):
+        funcs = [self._parse_not()]
+        while self._is_keyword('and'):
+            self._take()
+            funcs.append(self._parse_not())
+        if len(funcs) == 1:
+            return funcs[0]
+        return lambda p: all(f(p) for f in funcs)
+
+    def _parse_not(self):
+        if self._is_keyword('not'):
+            self._take()
+            func = self._parse_not()
+            return lambda p: not func(p)
+        return self._parse_atom()
+
+    def _parse_atom(self):
+        kind, value = self._peek()
+        if kind == 'paren' and value == '(':
+            self._take()
+            func = self._parse_or()
+            if self._take() != ('paren', ')'):
+                raise ValueError('missing ")" in filter: %s' % self.expression)
+            return func
+
+        left = self._parse_operand()
+        kind, value = self._peek()
+        if kind != 'op':
+            return left
+
+        self._take()
+        right = self._parse_operand()
+        op = self.operators[value]
+
+        def compare(p):
+            try:
+                return op(left(p), right(p))
+            except TypeError:
+                return False
+
+        return compare
+
+    def _parse_operand(self):
+        kind, value = self._take()
+        if kind == 'number':
+            v = float(value) if '.' in value else int(value)
+            return lambda p: v
+        elif kind == 'string':
+            v = value[1:-1]
+            return lambda p: v
+        elif kind == 'name' and value.lower() in self.constants:
+            v = self.constants[value.lower()]
+            return lambda p: v
+        elif kind == 'name' and value.lower() not in ['and', 'or', 'not']:
+            return lambda p: p.get(value)
+        raise ValueError('unexpected token "%s" in filter: %s' % (value, self.expression))
+
+
+class EventFilters:
+    """
+    Compiled filters cache with matched / suppressed counts per event.
+    """
+
+    def __init__(self):
+        self._filters = {}
+        self._lock = Lock()
+        self.stats = {}
+
+    def compile(self, expression: str) -> EventFilter:
+        with self._lock:
+            f = self._filters.get(expression)
+            if f is None:
+                f = self._filters[expression] = EventFilter(expression)
+        return f
+
+    def match(self, event: str, expression: str, params: dict):
+        """
+        Empty expression always match. Invalid expression raise ValueError.
+        """
+        matched = expression.strip() == '' or self.compile(expression)(params)
+        with self._lock:
+            stats = self.stats.setdefault(event, {'matched': 0, 'suppressed': 0})
+            stats['matched' if matched else 'suppressed'] += 1
+        return matched
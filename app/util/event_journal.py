@@ -0,0 +1,245 @@
+import bisect
+import json
+import os
+import time
+from queue import Queue, Empty
+from threading import Thread, Event
+
+from app.util import object_convert
+from app.util.log import Log
+
+
+class EventJournal:
+    """
+    Append-only JSONL journal of typed events.
+    Single writer thread, one fsync per batch (group commit),
+    segment rollover by size, with sparse "time offset" index file for each segment.
+    Keep newest max_segments segments, older segments are deleted on rollover.
+    """
+    segment_ext = '.jsonl'
+    index_ext = '.idx'
+
+    def __init__(self, path_dir, segment_max_bytes=4 * 1024 * 1024, index_interval=16 * 1024, max_segments=8):
+        self.path_dir = path_dir
+        self.segment_max_bytes = segment_max_bytes
+        self.max_segments = max(1, max_segments)
+        self.index_interval = index_interval
+
+        self._queue = Queue()
+        self._thread = None  # type: Thread
+        self._io = None
+        self._io_index = None
+        self._seq = 0
+        self._offset = 0
+        self._index_offset = None
+
+        self.stats = {'events': 0, 'batches': 0, 'fsyncs': 0, 'segments': 0}
+
+    def start(self):
+        if self._thread is None:
+            os.makedirs(self.path_dir, exist_ok=True)
+            self._thread = Thread(target=self._run, name='event_journal', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def append(self, event: str, params: dict, timestamp=None):
+        self.stats['events'] += 1
+        record = {'time': time.time() if timestamp is None else timestamp, 'event': event, 'params': params}
+        self._queue.put(record)
+        self.start()
+
+    def flush(self, timeout=None):
+        """
+        Wait until all appended records are durable.
+        """
+        if self._thread is None:
+            return True
+        done = Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    @staticmethod
+    def segment_seqs(path_dir):
+        if not os.path.isdir(path_dir):
+            return []
+        seqs = []
+        for f in os.listdir(path_dir):
+            name, ext = os.path.splitext(f)
+            if ext == EventJournal.segment_ext and name.isdigit():
+                seqs.append(int(name))
+        return sorted(seqs)
+
+    def _segment_path(self, seq, ext=segment_ext):
+        return os.path.join(self.path_dir, '%08d%s' % (seq, ext))
+
+    def _repair(self, seq):
+        """
+        Truncate torn last line (crash in the middle of write) and index entries beyond it.
+        """
+        path = self._segment_path(seq)
+        if not os.path.exists(path):
+            return
+        with open(path, 'r+b') as io:
+            size = io.seek(0, os.SEEK_END)
+            end = size
+            while end > 0:
+                pos = max(0, end - 4096)
+                io.seek(pos)
+                chunk = io.read(end - pos)
+                i = chunk.rfind(b'\n')
+                if i >= 0:
+                    end = pos + i + 1
+                    break
+                end = pos
+            if end == size:
+                return
+            io.truncate(end)
+            os.fsync(io.fileno())
+
+        path_index = self._segment_path(seq, self.index_ext)
+        [times, offsets] = self.read_index(path_index)
+        with open(path_index, 'w') as io:
+            io.writelines(['%f %d\n' % (t, o) for t, o in zip(times, offsets) if o < end])
+        Log.append(self._repair, 'Warning', 'journal segment %d truncated torn line: %d bytes.' % (seq, size - end))
+
+    def _prune(self):
+        seqs = self.segment_seqs(self.path_dir)
+        for seq in seqs[:-self.max_segments]:
+            for ext in [self.segment_ext, self.index_ext]:
+                try:
+                    os.unlink(self._segment_path(seq, ext))
+                except FileNotFoundError:
+                    pass
+
+    def _open(self, seq, repair=False):
+        self._close()
+        if repair:
+            self._repair(seq)
+        self._seq = seq
+        self._io = open(self._segment_path(seq), 'ab')
+        self._io_index = open(self._segment_path(seq, self.index_ext), 'a+')
+        self._offset = self._io.tell()
+        self._index_offset = None
+        self._io_index.seek(0)
+        for line in self._io_index:
+            self._index_offset = int(line.split()[1])
+        self.stats['segments'] += 1
+        self._prune()
+
+    def _close(self):
+        if self._io is not None:
+            self._io.close()
+            self._io_index.close()
+            self._io = None
+            self._io_index = None
+
+    def _write(self, records: list):
+        for record in records:
+            line = ('%s\n' % object_convert.to_json_line(record)).encode()
+            if self._io is None:
+                seqs = self.segment_seqs(self.path_dir)
+                self._open(seqs[-1] if len(seqs) > 0 else 0, repair=True)
+            if self._offset > 0 and self._offset + len(line) > self.segment_max_bytes:
+                self._commit()
+                self._open(self._seq + 1)
+
+            if self._index_offset is None or self._offset - self._index_offset >= self.index_interval:
+                self._io_index.write('%f %d\n' % (record['time'], self._offset))
+                self._index_offset = self._offset
+
+            self._io.write(line)
+            self._offset += len(line)
+
+        self._commit()
+
+    def _commit(self):
+        if self._io is not None:
+            self._io.flush()
+            os.fsync(self._io.fileno())
+            self._io_index.flush()
+            self.stats['fsyncs'] += 1
+
+    def _run(self):
+        stop = False
+        while not stop:
+            items = [self._queue.get()]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except Empty:
+                    break
+
+            records = [i for i in items if isinstance(i, dict)]
+            stop = None in items
+            try:
+                if len(records) > 0:
+                    self._write(records)
+                    self.stats['batches'] += 1
+            except:
+                Log.append_exception(self._run)
+                self._close()
+
+            for i in items:
+                if isinstance(i, Event):
+                    i.set()
+
+        self._close()
+
+    @staticmethod
+    def read_index(path_index):
+        times = []
+        offsets = []
+        if os.path.exists(path_index):
+            with open(path_index, 'r') as io:
+                for line in io:
+                    items = line.split()
+                    if len(items) == 2:
+                        times.append(float(items[0]))
+                        offsets.append(int(items[1]))
+        return times, offsets
+
+    @staticmethod
+    def read(path_dir, start=None, end=None, events=None):
+        """
+        Iterate records in time range [start, end], seek by sparse index.
+        """
+        seqs = EventJournal.segment_seqs(path_dir)
+        indexes = []
+        for seq in seqs:
+            indexes.append(EventJournal.read_index(os.path.join(path_dir, '%08d%s' % (seq, EventJournal.index_ext))))
+
+        for i, seq in enumerate(seqs):
+            # skip segment which next segment begin before start.
+            if start is not None and i + 1 < len(seqs) and len(indexes[i + 1][0]) > 0 \
+                    and indexes[i + 1][0][0] <= start:
+                continue
+
+            [times, offsets] = indexes[i]
+            if end is not None and len(times) > 0 and times[0] > end:
+                break
+
+            offset = 0
+            if start is not None and len(times) > 0:
+                pos = bisect.bisect_left(times, start) - 1
+                if pos >= 0:
+                    offset = offsets[pos]
+
+            with open(os.path.join(path_dir, '%08d%s' % (seq, EventJournal.segment_ext)), 'rb') as io:
+                io.seek(offset)
+                for line in io:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    t = record.get('time', 0)
+                    if start is not None and t < start:
+                        continue
+                    if end is not None and t > end:
+                        return
+                    if events is None or record.get('event') in events:
+                        yield record
@@ -0,0 +1,142 @@
+import time
+from collections import deque
+from threading import Lock
+
+
+class LatencyHistogram:
+    # upper bounds of buckets, unit: ms.
+    bounds = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf')]
+
+    def __init__(self):
+        self.counts = [0] * len(self.bounds)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value_ms: float):
+        for i, bound in enumerate(self.bounds):
+            if value_ms <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total += value_ms
+        self.min = value_ms if self.min is None else min(self.min, value_ms)
+        self.max = value_ms if self.max is None else max(self.max, value_ms)
+
+    def percentile(self, p: float):
+        if self.count == 0:
+            return None
+        target = self.count * p
+        current = 0
+        for i, count in enumerate(self.counts):
+            current += count
+            if current >= target:
+                return min(self.bounds[i], self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'avg': self.total / self.count if self.count > 0 else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'buckets': dict([(str(b), c) for b, c in zip(self.bounds, self.counts) if c > 0]),
+        }
+
+
+class EventTracer:
+    """
+    Monotonic timestamps of event stages, aggregate into per-event-type latency histograms.
+    stages: probe (sample begin) -> detect (sample end) -> enqueue -> hook_start -> hook_end
+    """
+    stages = ['probe', 'detect', 'enqueue', 'hook_start', 'hook_end']
+    # interval name -> (stage from, stage to)
+    intervals = {
+        'probe': ('probe', 'detect'),
+        'dispatch': ('detect', 'enqueue'),
+        'queue': ('enqueue', 'hook_start'),
+        'hook': ('hook_start', 'hook_end'),
+        'total': ('probe', 'hook_end'),
+    }
+
+    def __init__(self, max_recent=100):
+        self._histograms = {}
+        # recently finished traces.
+        self._recent = deque(maxlen=max_recent)
+        # event -> reason -> count, traces end before hook start.
+        self._discarded = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def new(event: str, probe=None, detect=None):
+        now = time.monotonic()
+        return {
+            'event': event,
+            'probe': probe if probe is not None else now,
+            'detect': detect if detect is not None else now,
+        }
+
+    @staticmethod
+    def mark(trace: dict, stage: str):
+        trace[stage] = time.monotonic()
+
+    def finish(self, trace: dict, outcome='done'):
+        with self._lock:
+            self._recent.append((time.time() - time.monotonic(), outcome, trace))
+            histograms = self._histograms.setdefault(trace['event'], {})
+            for name, [begin, end] in self.intervals.items():
+                if begin in trace and end in trace:
+                    histogram = histograms.get(name)
+                    if histogram is None:
+                        histogram = histograms[name] = LatencyHistogram()
+                    histogram.record((trace[end] - trace[begin]) * 1000)
+
+    def discard(self, trace: dict, reason: str):
+        """
+        Finish trace of event which hook never run (coalesced or dropped), only its stages before enqueue count.
+        """
+        self.finish(trace, reason)
+        with self._lock:
+            discarded = self._discarded.setdefault(trace['event'], {})
+            discarded[reason] = discarded.get(reason, 0) + 1
+
+    def export(self):
+        with self._lock:
+            result = dict([(event, dict([(name, h.to_dict()) for name, h in histograms.items()]))
+                           for event, histograms in self._histograms.items()])
+            for event, discarded in self._discarded.items():
+                result.setdefault(event, {})['discarded'] = discarded.copy()
+            return result
+
+    def recent(self):
+        """
+        :return: recent traces, oldest first, stages in ms after probe.
+        """
+        with self._lock:
+            items = list(self._recent)
+        result = []
+        for offset, outcome, trace in items:
+            result.append({
+                'event': trace['event'],
+                'outcome': outcome,
+                'time': offset + trace['probe'],
+                'stages': dict([(s, round((trace[s] - trace['probe']) * 1000, 3))
+                                for s in self.stages if s in trace]),
+            })
+        return result
+
+    def summary(self):
+        lines = []
+        for event, histograms in self.export().items():
+            lines.append(event)
+            for name, h in histograms.items():
+                if name == 'discarded':
+                    lines.append('  discarded: %s' % ', '.join(['%s=%d' % (k, v) for k, v in sorted(h.items())]))
+                    continue
+                lines.append('  %s: n=%d avg=%.2fms p90=%.2fms max=%.2fms' % (
+                    name, h['count'], h['avg'], h['p90'], h['max']))
+        return '\n'.join(lines)
@@ -0,0 +1,204 @@
+import time
+from collections import OrderedDict
+from threading import Thread, Condition, current_thread
+
+from app import common
+from app.util.log import Log
+
+
+class HookExecutor:
+    """
+    Fixed size worker pool with bounded queue for event hooks.
+    Same key burst coalesce into one task with the latest payload.
+    """
+    POLICY_DROP_OLDEST = 'drop_oldest'
+    POLICY_DROP_NEW = 'drop_new'
+
+    def __init__(self, workers=2, max_queue=16, policy=POLICY_DROP_OLDEST, coalesce=True, on_discard=None):
+        """
+        :param on_discard: callback(key, payload, reason) of queued task replaced by coalesce or dropped by policy,
+            reason: 'coalesced' or 'dropped'.
+        """
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self.policy = policy
+        self.coalesce = coalesce
+        self.on_discard = on_discard
+
+        self._queue = OrderedDict()
+        self._cond = Condition()
+        self._threads = []
+        self._running = False
+        self._seq = 0
+        # workers to exit, when worker count shrink.
+        self._retire = 0
+        self._thread_seq = 0
+
+        self._stats = {
+            'submitted': 0,
+            'executed': 0,
+            'coalesced': 0,
+            'dropped': 0,
+            'errors': 0,
+            'max_depth': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'exec_time_total': 0.0,
+            'exec_time_max': 0.0,
+        }
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+
+        for _ in range(self.workers):
+            self._spawn()
+
+    def _spawn(self):
+        with self._cond:
+            t = Thread(target=self._worker, name='hook_worker_%d' % self._thread_seq, daemon=True)
+            self._thread_seq += 1
+            self._threads.append(t)
+        t.start()
+
+    def stop(self, timeout=None):
+        with self._cond:
+            self._running = False
+            self._retire = 0
+            self._cond.notify_all()
+            threads = self._threads
+            self._threads = []
+
+        for t in threads:
+            t.join(timeout)
+
+    def configure(self, workers=None, max_queue=None, policy=None, coalesce=None):
+        """
+        Apply new settings to the executor, worker count grow or shrink in place, queued tasks are kept.
+        """
+        spawn = 0
+        with self._cond:
+            if max_queue is not None:
+                self.max_queue = max(1, max_queue)
+            if policy is not None:
+                self.policy = policy
+            if coalesce is not None:
+                self.coalesce = coalesce
+            if workers is not None:
+                workers = max(1, workers)
+                if self._running:
+                    if workers > self.workers:
+                        spawn = workers - self.workers
+                    elif workers < self.workers:
+                        self._retire += self.workers - workers
+                        self._cond.notify_all()
+                self.workers = workers
+
+        for _ in range(spawn):
+            self._spawn()
+
+    def submit(self, key, func, payload=None):
+        """
+        :return: False if task dropped by queue policy.
+        """
+        discarded = None
+        with self._cond:
+            self._stats['submitted'] += 1
+            if not self.coalesce:
+                self._seq += 1
+                key = (key, self._seq)
+
+            if key in self._queue:
+                self._stats['coalesced'] += 1
+                [_, payload_prev, enqueue_time] = self._queue[key]
+                self._queue[key] = (func, payload, enqueue_time)
+                discarded = (key, payload_prev, 'coalesced')
+            else:
+                discarded = self._enqueue(key, func, payload)
+                if discarded is False:
+                    return False
+
+        if discarded is not None and self.on_discard is not None:
+            self.on_discard(*discarded)
+
+        if not self._running:
+            self.start()
+
+        return True
+
+    def _enqueue(self, key, func, payload):
+        """
+        Call it with lock.
+        :return: False if new task dropped, (key, payload, reason) of dropped oldest task or None.
+        """
+        discarded = None
+        if len(self._queue) >= self.max_queue:
+            self._stats['dropped'] += 1
+            if self.policy == self.POLICY_DROP_NEW:
+                return False
+            [key_old, [_, payload_old, _]] = self._queue.popitem(last=False)
+            discarded = (key_old, payload_old, 'dropped')
+
+        self._queue[key] = (func, payload, time.monotonic())
+        self._stats['max_depth'] = max(self._stats['max_depth'], len(self._queue))
+        self._cond.notify()
+        return discarded
+
+    def _next(self):
+        with self._cond:
+            while self._running and len(self._queue) == 0 and self._retire == 0:
+                self._cond.wait()
+            if not self._running:
+                return None
+            if self._retire > 0:
+                self._retire -= 1
+                return None
+            return self._queue.popitem(last=False)
+
+    def _worker(self):
+        while True:
+            task = self._next()
+            if task is None:
+                with self._cond:
+                    if current_thread() in self._threads:
+                        self._threads.remove(current_thread())
+                break
+
+            [key, [func, payload, enqueue_time]] = task
+            start_time = time.monotonic()
+            error = False
+            try:
+                func(payload)
+            except:
+                error = True
+                Log.append(self._worker, 'Warning', 'hook %s failed.' % str(key), common.get_exception())
+            end_time = time.monotonic()
+
+            with self._cond:
+                self._record(start_time - enqueue_time, end_time - start_time, error)
+
+    def _record(self, wait_time, exec_time, error):
+        stats = self._stats
+        stats['executed'] += 1
+        if error:
+            stats['errors'] += 1
+        stats['wait_time_total'] += wait_time
+        stats['wait_time_max'] = max(stats['wait_time_max'], wait_time)
+        stats['exec_time_total'] += exec_time
+        stats['exec_time_max'] = max(stats['exec_time_max'], exec_time)
+
+    @property
+    def depth(self):
+        with self._cond:
+            return len(self._queue)
+
+    def metrics(self):
+        with self._cond:
+            metrics = self._stats.copy()
+            metrics['depth'] = len(self._queue)
+            executed = max(1, metrics['executed'])
+            metrics['wait_time_avg'] = metrics['wait_time_total'] / executed
+            metrics['exec_time_avg'] = metrics['exec_time_total'] / executed
+        return metrics
@@ -0,0 +1,138 @@
+import importlib.util
+import os
+from queue import Queue
+from threading import Thread, Event, Lock
+
+from app import common
+from app.util.log import Log
+
+
+class _CallRunner:
+    def __init__(self, name):
+        self._queue = Queue()
+        # timeout call blocked this runner, exit after the call return.
+        self.abandoned = False
+        self._thread = Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            [func, kwargs, result] = self._queue.get()
+            try:
+                result['return'] = func(**kwargs)
+            except:
+                result['exception'] = common.get_exception()
+            result['done'].set()
+            if self.abandoned:
+                break
+
+    def alive(self):
+        return self._thread.is_alive()
+
+    def call(self, func, kwargs: dict, timeout=None):
+        result = {'done': Event()}
+        self._queue.put((func, kwargs, result))
+        result['done'].wait(timeout)
+        return result
+
+
+class PluginHooks:
+    """
+    In-process python hooks, event path format: "py:<module file path or module name>".
+    The module import once, then call its "event_*" function with event params.
+    """
+    prefix = 'py:'
+    # runner threads still blocked by timeout calls, disable the plugin at this count.
+    max_abandoned = 3
+
+    def __init__(self):
+        self._modules = {}
+        self._runners = {}
+        # target -> abandoned runners
+        self._abandoned = {}
+        self._disabled = set()
+        self._lock = Lock()
+
+    @staticmethod
+    def check(path_event: str):
+        return path_event.startswith(PluginHooks.prefix)
+
+    def load(self, path_event: str):
+        target = path_event[len(self.prefix):].strip()
+        with self._lock:
+            module = self._modules.get(target)
+            if module is None:
+                path = os.path.expanduser(target)
+                if os.path.isfile(path):
+                    name = 'sleeperx_plugin_%s' % os.path.splitext(os.path.basename(path))[0]
+                    spec = importlib.util.spec_from_file_location(name, path)
+                    module = importlib.util.module_from_spec(spec)
+                    spec.loader.exec_module(module)
+                else:
+                    module = importlib.import_module(target)
+                self._modules[target] = module
+                Log.append(self.load, 'Info', 'plugin loaded: %s' % target)
+
+        return module
+
+    def _runner(self, target):
+        with self._lock:
+            runner = self._runners.get(target)
+            if runner is None:
+                runner = _CallRunner('plugin_%s' % target)
+                self._runners[target] = runner
+        return runner
+
+    def _abandon(self, target, runner):
+        # runner thread is blocked by timeout call, next call use a new runner.
+        with self._lock:
+            runner.abandoned = True
+            if self._runners.get(target) is runner:
+                self._runners.pop(target)
+            self._abandoned.setdefault(target, []).append(runner)
+
+    def _check_disabled(self, target):
+        """
+        Plugin is disabled while max_abandoned runner threads hang in it, enabled again when they return.
+        """
+        with self._lock:
+            runners = [r for r in self._abandoned.get(target, []) if r.alive()]
+            self._abandoned[target] = runners
+            if len(runners) < self.max_abandoned:
+                if target in self._disabled:
+                    self._disabled.remove(target)
+                    Log.append(self.call, 'Info', 'plugin enabled: %s' % target)
+                return False
+            if target not in self._disabled:
+                self._disabled.add(target)
+                Log.append(self.call, 'Warning', 'plugin disabled, %d calls hang: %s' % (len(runners), target))
+            return True
+
+    def call(self, path_event: str, name: str, params: dict, timeout=None):
+        """
+        :return: stat, out, err like common.execute
+        """
+        try:
+            module = self.load(path_event)
+        except:
+            return -1, '', common.get_exception()
+
+        func = getattr(module, name, None)
+        if not callable(func):
+            return 0, '', ''
+
+        target = path_event[len(self.prefix):].strip()
+        if self._check_disabled(target):
+            return -1, '', 'plugin %s disabled, too many timeout calls.' % target
+
+        runner = self._runner(target)
+        result = runner.call(func, params, timeout)
+        if not result['done'].is_set():
+            self._abandon(target, runner)
+            self._check_disabled(target)
+            return -1, '', 'plugin %s.%s timeout (%ss).' % (target, name, timeout)
+        elif 'exception' in result:
+            return 1, '', result['exception']
+        else:
+            ret = result.get('return')
+            return 0, '' if ret is None else str(ret), ''
@@ -0,0 +1,192 @@
+import os
+import select
+import time
+from collections import deque
+from subprocess import Popen
+from threading import Thread, Lock, Timer
+
+from app import common
+from app.util import object_convert
+from app.util.log import Log
+from app.util.process_limit import ProcessLimits, kill_group
+
+
+class HookWorker:
+    """
+    Persistent external hook program, event path format: "worker:<command>".
+    The program start once, and receive one compact JSON object per event on stdin:
+        {"event": "lid_status_changed", "params": {...}}
+    Restart with backoff if it exits or stalls (stdin not read in timeout),
+    events in backoff window are queued and sent after restart.
+    """
+    prefix = 'worker:'
+
+    backoff_min = 0.5
+    backoff_max = 30
+    # running longer than this, reset the backoff.
+    stable_time = 30
+    # queued events in backoff window, drop oldest when full.
+    max_pending = 64
+
+    def __init__(self, command: str, limits: ProcessLimits = None):
+        self.command = command
+        self.limits = limits if limits is not None else ProcessLimits()
+        self._process = None  # type: Popen
+        self._lock = Lock()
+        self._start_time = 0
+        self._backoff = 0
+        self._next_start_time = 0
+        self._pending = deque()
+        self._timer = None  # type: Timer
+        self._timeout = 5
+        self._stopped = False
+
+    @staticmethod
+    def check(path_event: str):
+        return path_event.startswith(HookWorker.prefix)
+
+    @staticmethod
+    def parse_command(path_event: str):
+        return path_event[len(HookWorker.prefix):].strip()
+
+    @property
+    def is_running(self):
+        return self._process is not None and self._process.poll() is None
+
+    def _start(self):
+        self._process = common.popen(self.limits.wrap(self.command), stdout=False, shell=True, bufsize=1,
+                                     **self.limits.popen_kwargs())
+        # write by os.write with deadline, never block the caller on a stalled worker.
+        os.set_blocking(self._process.stdin.fileno(), False)
+        self._start_time = time.monotonic()
+        Thread(target=self._read_err, args=(self._process,), daemon=True).start()
+        Log.append(self._start, 'Info', 'hook worker started: %s (pid: %d)' % (self.command, self._process.pid))
+
+    def _read_err(self, process: Popen):
+        for line in process.stderr:
+            Log.append(self.command, 'Event', line.rstrip('\n'))
+
+    def _on_exit(self):
+        now = time.monotonic()
+        if now - self._start_time >= self.stable_time:
+            self._backoff = 0
+        self._backoff = min(self.backoff_max, max(self.backoff_min, self._backoff * 2))
+        self._next_start_time = now + self._backoff
+
+        process = self._process
+        self._process = None
+        kill_group(process)
+        process.wait()
+        Log.append(self._on_exit, 'Warning', 'hook worker exited: %s (status: %s), restart after %.1fs.' % (
+            self.command, process.poll(), self._backoff))
+        self._schedule()
+
+    def _schedule(self):
+        # call it with lock, restart when backoff end if events are waiting.
+        if self._timer is None and len(self._pending) > 0 and not self._stopped:
+            self._timer = Timer(max(0.0, self._next_start_time - time.monotonic()), self._restart)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _restart(self):
+        with self._lock:
+            self._timer = None
+            if self._stopped:
+                return
+            if self._process is None and not self._ensure_started():
+                return
+            while len(self._pending) > 0:
+                line = self._pending.popleft()
+                [stat, _, err] = self._write(line)
+                if stat != 0:
+                    Log.append(self._restart, 'Warning', 'hook worker queued event failed.', err)
+                    break
+
+    def _ensure_started(self):
+        # call it with lock.
+        if time.monotonic() < self._next_start_time:
+            self._schedule()
+            return False
+        try:
+            self._start()
+        except OSError:
+            self._process = None
+            self._next_start_time = time.monotonic() + self.backoff_max
+            Log.append(self._start, 'Warning', common.get_exception())
+            self._schedule()
+            return False
+        return True
+
+    def _queue(self, line: str):
+        # call it with lock.
+        if len(self._pending) >= self.max_pending:
+            self._pending.popleft()
+            Log.append(self.send, 'Warning', 'hook worker pending queue full, drop oldest event: %s' % self.command)
+        self._pending.append(line)
+        self._schedule()
+
+    def _write(self, line: str):
+        """
+        Write line to stdin before deadline (process timeout), kill and restart the worker if it stall.
+        Call it with lock.
+        """
+        try:
+            fd = self._process.stdin.fileno()
+            data = memoryview(line.encode())
+            deadline = time.monotonic() + self._timeout
+            while len(data) > 0:
+                remain = deadline - time.monotonic()
+                if remain <= 0:
+                    raise TimeoutError('hook worker stdin stalled (%ss): %s' % (self._timeout, self.command))
+                [_, writable, _] = select.select([], [fd], [], remain)
+                if len(writable) > 0:
+                    try:
+                        data = data[os.write(fd, data):]
+                    except BlockingIOError:
+                        pass
+        except (OSError, ValueError):
+            self._on_exit()
+            return -1, '', common.get_exception()
+
+        return 0, '', ''
+
+    def send(self, event: str, params: dict, timeout=None):
+        """
+        :param timeout: stdin write deadline, unit: second.
+        :return: stat, out, err like common.execute
+        """
+        line = '%s\n' % object_convert.to_json_line({'event': event, 'params': params})
+        with self._lock:
+            if self._stopped:
+                # removed from app (config changed or quit), never start again.
+                return -1, '', 'hook worker retired: %s' % self.command
+            if timeout is not None:
+                self._timeout = timeout
+            if self._process is not None and self._process.poll() is not None:
+                self._on_exit()
+
+            # keep the order, queued events first.
+            if len(self._pending) > 0 or (self._process is None and not self._ensure_started()):
+                self._queue(line)
+                return 0, 'queued until hook worker restart: %s' % self.command, ''
+
+            return self._write(line)
+
+    def stop(self):
+        """
+        Stop and retire the worker, later send is refused, use a new worker instead.
+        """
+        with self._lock:
+            self._stopped = True
+            self._pending.clear()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._process is not None:
+                try:
+                    self._process.stdin.close()
+                    self._process.wait(1)
+                except:
+                    pass
+                kill_group(self._process)
+                self._process = None
@@ -1,11 +1,18 @@
+import atexit
+import gzip
+import json
 import os
+import re
+import shutil
 import sys
 import time
-from io import StringIO
-from threading import Lock
+import traceback
+from collections import deque, OrderedDict
+from threading import Lock, Thread, Event
 
 from app.res.const import Const
 from app.util import io_helper, object_convert
+from app.util.log_ring import LogRing
 
 
 class Log:
@@ -13,39 +20,237 @@ class Log:
 
     path_log = '%s/%s.log' % (log_dir, Const.app_name)
     path_err = '%s/%s.err.log' % (log_dir, Const.app_name)
+    path_journal = '%s/%s.events' % (log_dir, Const.app_name)
+    path_hook_output = '%s/%s.hooks' % (log_dir, Const.app_name)
+    path_query = '%s/%s.query.log' % (log_dir, Const.app_name)
+    path_json = '%s/%s.jsonl' % (log_dir, Const.app_name)
 
-    io_log = StringIO()
-    io_err = StringIO()
+    # bounded memory backend, until init_app (or forever without app shell).
+    io_log = LogRing()
+    io_err = LogRing()
+    # structured output, one compact json record per line. (None: write to io_log)
+    io_json = None
     replaces = {}
+    reg_replaces = None
     lock_log = Lock()
 
+    # other tags (such as "Event") are Info level.
+    levels = {'Debug': 10, 'Info': 20, 'Warning': 30, 'Error': 40}
+    level = levels['Info']
+
+    # output format: "text" or "both" (text and jsonl), text log is always written for log readers.
+    formats = ['text', 'both']
+    format_json = False
+
+    # async writer, callers enqueue formatted records, writer thread batch write and flush.
+    queue = deque()
+    queue_json = deque()
+    queue_max = 10000
+    flush_interval = 0.5
+    flush_size = 64 * 1024
+    dropped = 0
+    _queue_size = 0
+    _event_write = Event()
+    _t_writer = None  # type: Thread
+
+    # repeating exception dedup, key: (source, exception type, message hash)
+    dedup_interval = 600
+    dedup_max = 256
+    _dedup = OrderedDict()
+    _lock_dedup = Lock()
+
+    # rotation of log file, done by writer thread. (0 is unlimited)
+    rotate_max_bytes = 10 * 1024 * 1024
+    rotate_max_age = 7 * 86400
+    rotate_keep = 5
+    rotate_compress = True
+    _log_begin_time = time.time()
+
     @staticmethod
     def init_app(keep_log=False):
         mode = 'a+' if keep_log else 'w+'
-        Log.io_log = open(Log.path_log, mode)
-        Log.io_err = open(Log.path_err, mode)
+        Log.flush()
+        with Log.lock_log:
+            ring = Log.io_log
+            Log.io_log = open(Log.path_log, mode)
+            Log.io_err = open(Log.path_err, mode)
+
+            Log._log_begin_time = time.time()
+            if keep_log:
+                stat = os.stat(Log.path_log)
+                Log._log_begin_time = getattr(stat, 'st_birthtime',
+                                              stat.st_mtime if stat.st_size > 0 else time.time())
+
+            if isinstance(ring, LogRing):
+                # keep records before file logging.
+                ring.handoff(Log.io_log)
+
+            # redirect stdout and stderr.
+            sys.stdout = Log.io_log
+            sys.stderr = Log.io_err
 
-        # redirect stdout and stderr.
-        sys.stdout = Log.io_log
-        sys.stderr = Log.io_err
+    @staticmethod
+    def set_rotation(max_bytes=None, max_age=None, keep=None, compress=None):
+        if max_bytes is not None:
+            Log.rotate_max_bytes = max_bytes
+        if max_age is not None:
+            Log.rotate_max_age = max_age
+        if keep is not None:
+            Log.rotate_keep = max(1, keep)
+        if compress is not None:
+            Log.rotate_compress = compress
+
+    @staticmethod
+    def rotated_paths(path=None):
+        """
+        :return: rotated segments of log, newest first.
+        """
+        if path is None:
+            path = Log.path_log
+        reg = re.compile(r'^%s\.(\d+)(\.gz)?$' % re.escape(os.path.basename(path)))
+        items = []
+        if os.path.isdir(os.path.dirname(path)):
+            for f in os.listdir(os.path.dirname(path)):
+                match = reg.match(f)
+                if match is not None:
+                    items.append((int(match.group(1)), os.path.join(os.path.dirname(path), f)))
+        return [p for _, p in sorted(items)]
+
+    @staticmethod
+    def _need_rotate():
+        if Log.io_log is not sys.stdout or isinstance(Log.io_log, LogRing):
+            return False
+        size = max(Log.io_log.tell(), Log.io_json.tell() if Log.io_json is not None else 0)
+        if Log.rotate_max_bytes > 0 and size >= Log.rotate_max_bytes:
+            return True
+        if Log.rotate_max_age > 0 and time.time() - Log._log_begin_time >= Log.rotate_max_age:
+            return size > 0
+        return False
+
+    @staticmethod
+    def _shift(path):
+        """
+        Shift "x.log.n" to "x.log.n+1", drop segments beyond keep, then move "x.log" to "x.log.1".
+        """
+        for p in reversed(Log.rotated_paths(path)):
+            name = os.path.basename(p)[len(os.path.basename(path)) + 1:]
+            [i, _, ext] = name.partition('.')
+            i = int(i)
+            if i >= Log.rotate_keep:
+                os.unlink(p)
+            else:
+                os.rename(p, '%s.%d%s' % (path, i + 1, '.' + ext if ext else ''))
+        os.rename(path, '%s.1' % path)
+
+    @staticmethod
+    def rotate():
+        paths = [Log.path_log]
+        with Log.lock_log:
+            if not Log._need_rotate():
+                return
+
+            # rename the open file, switch stdout to the new file, close the old one at last,
+            # other threads writing stdout never see a closed file.
+            io_old = Log.io_log
+            io_old.flush()
+            Log._shift(Log.path_log)
+            Log.io_log = open(Log.path_log, 'w+')
+            sys.stdout = Log.io_log
+            io_old.close()
+            if Log.io_json is not None:
+                io_old = Log.io_json
+                io_old.flush()
+                Log._shift(Log.path_json)
+                Log.io_json = open(Log.path_json, 'w+')
+                io_old.close()
+                paths.append(Log.path_json)
+            Log._log_begin_time = time.time()
+
+        if Log.rotate_compress:
+            for path in paths:
+                with open('%s.1' % path, 'rb') as io_src, gzip.open('%s.1.gz' % path, 'wb') as io_dest:
+                    shutil.copyfileobj(io_src, io_dest)
+                os.unlink('%s.1' % path)
+
+    @staticmethod
+    def set_format(fmt: str):
+        """
+        :param fmt: "text" or "both".
+        With file logging, structured records write to path_json, otherwise to stdout.
+        """
+        if fmt not in Log.formats:
+            fmt = 'text'
+        Log.flush()
+        with Log.lock_log:
+            Log.format_json = fmt == 'both'
+            file_logging = Log.io_log is sys.stdout and not isinstance(Log.io_log, LogRing)
+            if Log.format_json and file_logging and Log.io_json is None:
+                Log.io_json = open(Log.path_json, 'a+')
+            elif not Log.format_json and Log.io_json is not None:
+                Log.io_json.close()
+                Log.io_json = None
+
+    @staticmethod
+    def set_level(level: str):
+        Log.level = Log.levels.get(level, Log.levels['Info'])
+
+    @staticmethod
+    def enabled(tag='Info', level=None):
+        return Log.levels.get(level or tag, Log.levels['Info']) >= Log.level
 
     @staticmethod
     def set_replaces(replaces: dict):
+        """
+        Compile replaces into one alternation regex, longer keys first,
+        so a key which is substring of another key never leak the rest.
+        JSON escaped form of keys are matched too, records may contain json encoded arguments.
+        """
         Log.replaces = replaces
+        mapping = {}
+        for k, v in replaces.items():
+            if k is None or k == '':
+                continue
+            k = str(k)
+            mapping[k] = v
+            for escaped in [json.dumps(k, ensure_ascii=False)[1:-1], json.dumps(k)[1:-1]]:
+                mapping.setdefault(escaped, v)
+
+        keys = sorted(mapping, key=len, reverse=True)
+        if len(keys) > 0:
+            # keep regex with its mapping, replace them together.
+            Log.reg_replaces = (re.compile('|'.join([re.escape(k) for k in keys])), mapping)
+        else:
+            Log.reg_replaces = None
 
     @staticmethod
     def extract_log():
+        Log.flush()
+        if isinstance(Log.io_log, LogRing):
+            return Log.io_log.getvalue()
         with Log.lock_log:
             log = io_helper.read_all(Log.io_log, '')
         return log
 
     @staticmethod
     def extract_err():
+        if isinstance(Log.io_err, LogRing):
+            return Log.io_err.getvalue()
         err = io_helper.read_all(Log.io_err, '')
         return err
 
     @staticmethod
-    def append(src, tag='Info', *args):
+    def append(src, tag='Info', *args, level=None):
+        """
+        :param level: record level, default by tag. Disabled record return before format arguments.
+        """
+        if not Log.enabled(tag, level):
+            return
+
+        source = Log._source_name(src)
+        now = time.time()
+        if Log.format_json:
+            Log.append_json(source, tag, args, now, level)
+
         log_items = []
         for i in args:
             if isinstance(i, list) or isinstance(i, dict):
@@ -58,23 +263,198 @@ class Log:
                 log_items.append(i)
                 log_items.append(object_convert.to_json(object_convert.object_to_dict(i)))
 
+        items_str = ' '.join([str(item) for item in log_items])
+        record = '[%s] %s %s\n\t %s\n' % (tag, time.ctime(now), source, items_str)
+        Log._enqueue(Log.redact(record))
+
+    @staticmethod
+    def append_json(source: str, tag, args, now=None, level=None):
+        """
+        Structured record: {"time": epoch, "level": ..., "tag": ..., "source": ..., "fields": [...]}.
+        Fields keep their json types, serialize once per record.
+        """
+        fields = []
+        for i in args:
+            if isinstance(i, (tuple, set)):
+                fields.append(list(i))
+            elif i is None or isinstance(i, (str, int, float, bool, list, dict)):
+                fields.append(i)
+            else:
+                fields.append({'type': i.__class__.__name__, 'value': object_convert.object_to_dict(i)})
+
+        record = {
+            'time': time.time() if now is None else now,
+            'level': level or (tag if tag in Log.levels else 'Info'),
+            'tag': tag,
+            'source': source,
+            'fields': fields,
+        }
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=str)
+        Log._enqueue('%s\n' % Log.redact(line), Log.queue_json)
+
+    @staticmethod
+    def _source_name(src):
         if isinstance(src, str):
-            source = src
+            return src
+        else:
+            return src.__name__
+
+    @staticmethod
+    def append_exception(src, tag='Warning', level=None):
+        """
+        Append current exception traceback, deduplicate repeating failure.
+        Emit the first occurrence, then "repeated N times" summary once per dedup_interval,
+        the writer thread emit due summary if the failure stop repeating.
+        """
+        if not Log.enabled(tag, level):
+            return
+
+        [exc_type, exc, _] = sys.exc_info()
+        source = Log._source_name(src)
+        key = (source, exc_type.__name__ if exc_type is not None else None, hash(str(exc)))
+        now = time.monotonic()
+        with Log._lock_dedup:
+            entry = Log._dedup.get(key)
+            if entry is None:
+                Log._dedup[key] = entry = {'time': now, 'repeated': 0, 'src': src, 'tag': tag, 'level': level,
+                                           'message': str(exc)}
+                if len(Log._dedup) > Log.dedup_max:
+                    Log._dedup.popitem(last=False)
+                repeated = None
+            else:
+                Log._dedup.move_to_end(key)
+                entry['repeated'] += 1
+                if now - entry['time'] < Log.dedup_interval:
+                    return
+                repeated = entry['repeated']
+                entry['time'] = now
+                entry['repeated'] = 0
+
+        if repeated is None:
+            Log.append(src, tag, traceback.format_exc(), level=level)
         else:
-            source = src.__name__
+            Log._append_repeated(key, entry, repeated)
+
+    @staticmethod
+    def _append_repeated(key, entry, repeated):
+        Log.append(entry['src'], entry['tag'], '%s: %s repeated %d times in last %ds.' % (
+            key[1], entry['message'], repeated, Log.dedup_interval), level=entry['level'])
+
+    @staticmethod
+    def _flush_dedup():
+        """
+        Emit summary of repeated exceptions which dedup interval passed.
+        """
+        now = time.monotonic()
+        due = []
+        with Log._lock_dedup:
+            for key, entry in Log._dedup.items():
+                if entry['repeated'] > 0 and now - entry['time'] >= Log.dedup_interval:
+                    due.append((key, entry, entry['repeated']))
+                    entry['time'] = now
+                    entry['repeated'] = 0
+
+        for key, entry, repeated in due:
+            Log._append_repeated(key, entry, repeated)
+
+    @staticmethod
+    def redact(content: str):
+        if Log.reg_replaces is None:
+            return content
+        [reg, replaces] = Log.reg_replaces
+        return reg.sub(lambda m: replaces[m.group(0)], content)
 
-        items_str = []
-        for item in log_items:
-            item_str = str(item)
-            if len(Log.replaces) > 0:
-                for k, v in Log.replaces.items():
-                    if k is not None and k != '':
-                        item_str = item_str.replace(k, v)
+    @staticmethod
+    def _enqueue(record: str, queue=None):
+        if queue is None:
+            queue = Log.queue
+        if len(queue) >= Log.queue_max:
+            queue.popleft()
+            Log.dropped += 1
+        queue.append(record)
+        Log._queue_size += len(record)
+
+        if Log._t_writer is None:
+            Log._start_writer()
+        if Log._queue_size >= Log.flush_size:
+            Log._event_write.set()
+
+    @staticmethod
+    def _start_writer():
+        with Log.lock_log:
+            if Log._t_writer is None:
+                Log._t_writer = Thread(target=Log._writer, name='log_writer', daemon=True)
+                Log._t_writer.start()
+                atexit.register(Log.flush)
 
-            items_str.append(item_str)
+    @staticmethod
+    def _writer():
+        while True:
+            Log._event_write.wait(Log.flush_interval)
+            Log._event_write.clear()
+            Log._flush_dedup()
+            try:
+                Log.flush()
+            except Exception:
+                # keep the writer alive, failed records are counted in dropped summary.
+                Log._report_error('log write failed')
+                continue
+            try:
+                Log.rotate()
+            except OSError:
+                Log._report_error('log rotate failed')
 
-        items_str = ' '.join(items_str)
+    @staticmethod
+    def _report_error(message):
+        try:
+            sys.__stderr__.write('%s: %r\n' % (message, sys.exc_info()[1]))
+            sys.__stderr__.flush()
+        except (OSError, ValueError, AttributeError):
+            pass
 
+    @staticmethod
+    def flush():
+        """
+        Write all queued records. Also call it on crash, before the process exit.
+        """
         with Log.lock_log:
-            print('[%s] %s %s\n\t' % (tag, time.ctime(), source), items_str)
-            Log.io_log.flush()
+            records = []
+            while True:
+                try:
+                    records.append(Log.queue.popleft())
+                except IndexError:
+                    break
+            Log._queue_size = 0
+
+            # records not written if write fail, count them as dropped.
+            lost = len(records)
+            dropped = Log.dropped
+            if dropped > 0:
+                records.append('[Warning] %s log\n\t %d records dropped by full queue or failed write.\n' % (
+                    time.ctime(), dropped))
+                Log.dropped = 0
+
+            records_json = []
+            while True:
+                try:
+                    records_json.append(Log.queue_json.popleft())
+                except IndexError:
+                    break
+
+            try:
+                if Log.io_json is not None:
+                    if len(records_json) > 0:
+                        Log.io_json.write(''.join(records_json))
+                        Log.io_json.flush()
+                else:
+                    records += records_json
+                    lost += len(records_json)
+
+                if len(records) > 0:
+                    sys.stdout.write(''.join(records))
+                    sys.stdout.flush()
+                    if Log.io_log is not sys.stdout:
+                        Log.io_log.writelines(records)
+            except:
+                Log.dropped += lost + dropped
+                raise
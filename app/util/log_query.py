@@ -0,0 +1,218 @@
+import bisect
+import gzip
+import mmap
+import os
+import re
+import sys
+import time
+
+from app.util.log import Log
+
+
+class LogQuery:
+    """
+    Query log segments (rotated and current) without reading whole file into memory.
+    Plain segments are mmapped with a sparse timestamp -> offset index, gz segments are streamed.
+    """
+    reg_header = re.compile(
+        rb'^\[(?P<tag>[^\]\n]*)\] (?P<time>\w{3} \w{3} [ \d]\d \d\d:\d\d:\d\d \d{4}) (?P<source>[^\n]*)\n', re.M)
+    index_interval = 64 * 1024
+    # path -> (inode, size, times, offsets)
+    _indexes = {}
+
+    def __init__(self, path=None):
+        self.path = path if path is not None else Log.path_log
+
+    @staticmethod
+    def parse_time(ctime: bytes):
+        return time.mktime(time.strptime(ctime.decode(), '%a %b %d %H:%M:%S %Y'))
+
+    def segments(self):
+        """
+        :return: segment paths, oldest first.
+        """
+        paths = list(reversed(Log.rotated_paths(self.path)))
+        if os.path.exists(self.path):
+            paths.append(self.path)
+        return paths
+
+    def _index(self, path, mm):
+        """
+        Sparse index of plain segment, extend incrementally while the file grows.
+        """
+        stat = os.stat(path)
+        [inode, size, times, offsets] = self._indexes.get(path, (None, 0, [], []))
+        if inode != stat.st_ino or size > len(mm):
+            [size, times, offsets] = [0, [], []]
+
+        pos = size
+        while pos < len(mm):
+            match = self.reg_header.search(mm, pos)
+            if match is None:
+                break
+            times.append(self.parse_time(match.group('time')))
+            offsets.append(match.start())
+            pos = max(match.end(), match.start() + self.index_interval)
+
+        self._indexes[path] = (stat.st_ino, len(mm), times, offsets)
+        return times, offsets
+
+    def _records(self, content, offset=0):
+        """
+        Iterate (offset, tag, time, source, body) of content.
+        """
+        match = self.reg_header.search(content, offset)
+        while match is not None:
+            match_next = self.reg_header.search(content, match.end())
+            end = match_next.start() if match_next is not None else len(content)
+            yield (match.start(), match.group('tag').decode(), match.group('time'),
+                   match.group('source').decode(errors='replace'),
+                   bytes(content[match.end():end]).decode(errors='replace'))
+            match = match_next
+
+    def _segment_records(self, path, start=None):
+        if path.endswith('.gz'):
+            # stream gz segment by record, memory bound by the largest record.
+            with gzip.open(path, 'rb') as io:
+                buffer = b''
+                for line in io:
+                    if self.reg_header.match(line) is not None and buffer != b'':
+                        yield from self._records(buffer)
+                        buffer = b''
+                    buffer += line
+                if buffer != b'':
+                    yield from self._records(buffer)
+            return
+
+        if os.path.getsize(path) == 0:
+            return
+        with open(path, 'rb') as io, mmap.mmap(io.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offset = 0
+            if start is not None:
+                [times, offsets] = self._index(path, mm)
+                pos = bisect.bisect_left(times, start) - 1
+                if pos >= 0:
+                    offset = offsets[pos]
+            yield from self._records(mm, offset)
+
+    def query(self, start=None, end=None, tags=None, source=None, text=None):
+        """
+        :param start, end: epoch time range.
+        :param tags: tags set, case insensitive.
+        :param source, text: substring of source / content, case insensitive.
+        :return: iterator of formatted records.
+        """
+        match = self._matcher(tags, source, text)
+        for path in self.segments():
+            for [_, tag, t, src, body] in self._segment_records(path, start):
+                if start is not None or end is not None:
+                    t_value = self.parse_time(t)
+                    if start is not None and t_value < start:
+                        continue
+                    if end is not None and t_value > end:
+                        return
+                if match(tag, src, body):
+                    yield '[%s] %s %s\n%s' % (tag, t.decode(), src, body)
+
+    @staticmethod
+    def _matcher(tags=None, source=None, text=None):
+        tags = set([t.lower() for t in tags]) if tags else None
+        source = source.lower() if source else None
+        text = text.lower() if text else None
+
+        def match(tag, src, body):
+            if tags is not None and tag.lower() not in tags:
+                return False
+            if source is not None and source not in src.lower():
+                return False
+            if text is not None and text not in body.lower():
+                return False
+            return True
+
+        return match
+
+    def follow(self, interval=1.0, tags=None, source=None, text=None):
+        """
+        Follow the current log like `tail -f`, reopen on rotation.
+        """
+        match = self._matcher(tags, source, text)
+        io = None
+        inode = None
+        buffer = b''
+        while True:
+            if io is None and os.path.exists(self.path):
+                io = open(self.path, 'rb')
+                if inode is None:
+                    io.seek(0, 2)
+                inode = os.fstat(io.fileno()).st_ino
+
+            data = io.read() if io is not None else b''
+            if data != b'':
+                buffer += data
+                # keep the last (maybe incomplete) record in buffer.
+                last = None
+                for last in self.reg_header.finditer(buffer):
+                    pass
+                if last is not None and last.start() > 0:
+                    for [_, tag, t, src, body] in self._records(buffer[:last.start()]):
+                        if match(tag, src, body):
+                            yield '[%s] %s %s\n%s' % (tag, t.decode(), src, body)
+                    buffer = buffer[last.start():]
+            else:
+                # no more data, the last record is complete.
+                for [_, tag, t, src, body] in self._records(buffer):
+                    if match(tag, src, body):
+                        yield '[%s] %s %s\n%s' % (tag, t.decode(), src, body)
+                buffer = b''
+                try:
+                    if io is not None and os.stat(self.path).st_ino != inode:
+                        io.close()
+                        io = None
+                        inode = 0
+                except FileNotFoundError:
+                    pass
+                time.sleep(interval)
+
+
+def parse_time_arg(value: str):
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return time.mktime(time.strptime(value, '%Y-%m-%d %H:%M:%S'))
+
+
+def parse_args(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog='log_query', description='Query SleeperX log.')
+    parser.add_argument('--path', default=Log.path_log)
+    parser.add_argument('--since', type=float, help='seconds ago.')
+    parser.add_argument('--start', help='epoch or "Y-m-d H:M:S".')
+    parser.add_argument('--end', help='epoch or "Y-m-d H:M:S".')
+    parser.add_argument('--tag', action='append')
+    parser.add_argument('--source')
+    parser.add_argument('--text')
+    parser.add_argument('-f', '--follow', action='store_true')
+    return parser.parse_args(argv)
+
+
+def run(argv, io=None):
+    if io is None:
+        io = sys.stdout
+    args = parse_args(argv)
+    query = LogQuery(args.path)
+    start = parse_time_arg(args.start)
+    if args.since is not None:
+        start = time.time() - args.since
+
+    for record in query.query(start, parse_time_arg(args.end), args.tag, args.source, args.text):
+        io.write(record)
+    if args.follow:
+        for record in query.follow(tags=args.tag, source=args.source, text=args.text):
+            io.write(record)
+            io.flush()
+
+
+if __name__ == '__main__':
+    run(sys.argv[1:])
@@ -0,0 +1,54 @@
+from collections import deque
+from threading import Lock
+
+
+class LogRing:
+    """
+    Bounded in-memory log backend, keep the last records within max_records and max_bytes.
+    Used before and without file logging, contents can be handed off to the log file later.
+    """
+
+    def __init__(self, max_records=5000, max_bytes=4 * 1024 * 1024):
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.dropped = 0
+
+        self._records = deque()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._records)
+
+    def write(self, record: str):
+        with self._lock:
+            self._records.append(record)
+            self.size += len(record)
+            while len(self._records) > 1 and (
+                    len(self._records) > self.max_records or self.size > self.max_bytes):
+                self.size -= len(self._records.popleft())
+                self.dropped += 1
+
+    def writelines(self, records):
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        with self._lock:
+            return ''.join(self._records)
+
+    def handoff(self, io):
+        """
+        Write all records into io (file backend) and clear the ring.
+        """
+        with self._lock:
+            if self.dropped > 0:
+                io.write('[Warning] log ring\n\t %d records dropped before file logging.\n' % self.dropped)
+            io.writelines(self._records)
+            io.flush()
+            self._records.clear()
+            self.size = 0
+            self.dropped = 0
@@ -0,0 +1,69 @@
+from threading import Lock, current_thread, main_thread
+
+
+class MenuView:
+    """
+    View model of menu items: any thread set desired title / state,
+    main run loop render the changes in one batch, skip values already rendered.
+    """
+    fields = ('title', 'state')
+
+    def __init__(self):
+        self._lock = Lock()
+        # id(menu) -> (menu, {field: value})
+        self._desired = {}
+        self._rendered = {}
+        self._dirty = set()
+
+    def set(self, menu, title=None, state=None):
+        key = id(menu)
+        with self._lock:
+            item = self._desired.get(key)
+            if item is None:
+                item = self._desired[key] = (menu, {})
+            values = item[1]
+            if title is not None:
+                values['title'] = title
+            if state is not None:
+                values['state'] = bool(state)
+            self._dirty.add(key)
+
+    def state(self, menu):
+        """
+        Desired state, include the change not yet rendered.
+        """
+        with self._lock:
+            item = self._desired.get(id(menu))
+            if item is not None and 'state' in item[1]:
+                return item[1]['state']
+        return bool(menu.state)
+
+    def title(self, menu):
+        with self._lock:
+            item = self._desired.get(id(menu))
+            if item is not None and 'title' in item[1]:
+                return item[1]['title']
+        return menu.title
+
+    def render(self):
+        """
+        Apply changed titles and states, call it on main thread (rumps.Timer callback or menu callback).
+        :return: count of applied changes.
+        """
+        if current_thread() is not main_thread():
+            return 0
+
+        with self._lock:
+            changes = []
+            for key in self._dirty:
+                [menu, values] = self._desired[key]
+                rendered = self._rendered.setdefault(key, {})
+                for field, value in values.items():
+                    if rendered.get(field) != value:
+                        rendered[field] = value
+                        changes.append((menu, field, value))
+            self._dirty.clear()
+
+        for menu, field, value in changes:
+            setattr(menu, field, value)
+        return len(changes)
@@ -5,6 +5,10 @@ def to_json(obj):
     return json.dumps(obj, indent=4, ensure_ascii=False)
 
 
+def to_json_line(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+
 def from_json(obj_str):
     try:
         return json.loads(obj_str)
@@ -24,6 +28,7 @@ def object_to_dict(obj):
 
 
 def dict_to_object(d: dict, obj=object(), new_fields=True):
+    fields = None if new_fields else set(dir(obj))
     for k, v in d.items():
-        if new_fields or k in dir(obj):
+        if fields is None or k in fields:
             setattr(obj, k, v)
@@ -0,0 +1,102 @@
+import os
+from collections import deque
+from threading import Lock
+
+
+class BoundedCapture:
+    """
+    Capture stream into fixed size memory, keep the head and the tail.
+    If spool path set, whole stream spool to file once it exceeds the limit.
+    Thread safe, write after close is ignored (reader thread outlive the timeout join).
+    """
+    # spool files kept in spool directory, newest first.
+    spool_keep = 64
+
+    def __init__(self, limit=64 * 1024, spool_path=None):
+        self.limit = limit
+        self.spool_path = spool_path
+        self.size = 0
+
+        self._head = bytearray()
+        self._tail = deque()
+        self._tail_size = 0
+        self._spool = None
+        self._closed = False
+        self._lock = Lock()
+
+    @property
+    def truncated(self):
+        return self.size > self.limit
+
+    def write(self, data: bytes):
+        with self._lock:
+            if not self._closed:
+                self._write(data)
+
+    def _write(self, data: bytes):
+        self.size += len(data)
+
+        head_limit = self.limit // 2
+        if len(self._head) < head_limit:
+            n = head_limit - len(self._head)
+            self._head += data[:n]
+            data = data[n:]
+
+        if len(data) == 0:
+            return
+
+        if self._spool is None and self.spool_path is not None and self.truncated:
+            self._spool = open(self.spool_path, 'wb')
+            self._spool.write(self._head)
+            for chunk in self._tail:
+                self._spool.write(chunk)
+        if self._spool is not None:
+            self._spool.write(data)
+
+        tail_limit = self.limit - head_limit
+        data = data[-tail_limit:] if tail_limit > 0 else b''
+        self._tail.append(data)
+        self._tail_size += len(data)
+        while self._tail_size - len(self._tail[0]) >= tail_limit:
+            self._tail_size -= len(self._tail.popleft())
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            if self._spool is not None:
+                self._spool.close()
+
+    def getvalue(self, encoding='utf-8'):
+        with self._lock:
+            return self._getvalue(encoding)
+
+    def _getvalue(self, encoding):
+        tail = b''.join(self._tail)
+        if not self.truncated:
+            return (bytes(self._head) + tail).decode(encoding, 'replace')
+
+        tail = tail[-(self.limit - len(self._head)):]
+        marker = '\n... [%d bytes truncated%s] ...\n' % (
+            self.size - len(self._head) - len(tail),
+            ', full output: %s' % self.spool_path if self._spool is not None else '')
+        return '%s%s%s' % (bytes(self._head).decode(encoding, 'replace'), marker, tail.decode(encoding, 'replace'))
+
+    @staticmethod
+    def prune(path_dir, keep=None):
+        """
+        Delete spool files in directory except the newest keep files.
+        """
+        if keep is None:
+            keep = BoundedCapture.spool_keep
+        try:
+            items = []
+            for entry in os.scandir(path_dir):
+                if entry.is_file():
+                    items.append((entry.stat().st_mtime, entry.path))
+        except FileNotFoundError:
+            return
+        for _, path in sorted(items, reverse=True)[keep:]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,110 @@
+import time
+from threading import Lock
+
+from app.util import system_api
+from app.util.log import Log
+
+
+class PMSetReconciler:
+    """
+    Track the last known pmset settings, drop writes that change nothing
+    and merge pending changes into one privileged pmset invocation per scope.
+    Known value older than max_age is read again before eliding, other programs may change it.
+    """
+    # unit: second
+    max_age = 5
+    # pmset scope option of setting, default "-a" (all power sources).
+    scopes = {
+        'hibernatemode': '',
+    }
+
+    # pmset setting name -> key reported by `pmset -g live`.
+    live_keys = {
+        'disablesleep': 'SleepDisabled',
+    }
+    # value of settings which `pmset -g live` omit when unset.
+    live_defaults = {
+        'disablesleep': 0,
+    }
+
+    def __init__(self, ex_func):
+        self._ex_func = ex_func
+        # key -> (value, monotonic update time)
+        self._known = {}
+        self._pending = {}
+        self._lock = Lock()
+
+    def update(self, info: dict):
+        """
+        Update known settings from `system_api.sleep_info` items.
+        """
+        if len(info) == 0:
+            # read failed, keep known settings.
+            return
+        now = time.monotonic()
+        with self._lock:
+            for k, v in self.live_defaults.items():
+                self._known[k] = (v, now)
+            live_settings = dict([(v, k) for k, v in self.live_keys.items()])
+            for k, v in info.items():
+                self._known[live_settings.get(k, k)] = (v, now)
+
+    def refresh(self):
+        [info, _] = system_api.sleep_info()
+        self.update(info)
+        return info
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._known.get(key, (default, None))[0]
+
+    def known(self):
+        with self._lock:
+            return dict([(k, v) for k, [v, _] in self._known.items()])
+
+    def is_fresh(self, key):
+        with self._lock:
+            known = self._known.get(key)
+            return known is not None and time.monotonic() - known[1] <= self.max_age
+
+    def set(self, key, value):
+        with self._lock:
+            known = self._known.get(key)
+            if known is not None and known[0] == value and time.monotonic() - known[1] <= self.max_age:
+                self._pending.pop(key, None)
+            else:
+                self._pending[key] = value
+
+    def apply(self, **settings):
+        """
+        Set settings, then write all pending changes in one pmset command.
+        :return: success, the settings already have requested value also success.
+        """
+        if len([k for k in settings if not self.is_fresh(k)]) > 0:
+            self.refresh()
+        for k, v in settings.items():
+            self.set(k, v)
+
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+
+        if len(pending) == 0:
+            return True
+
+        groups = {}
+        for k, v in pending.items():
+            groups.setdefault(self.scopes.get(k, '-a'), {})[k] = v
+        success = True
+        for scope, group in groups.items():
+            success = system_api.set_pmset(group, self._ex_func, scope) and success
+        if success:
+            now = time.monotonic()
+            with self._lock:
+                self._known.update([(k, (v, now)) for k, v in pending.items()])
+        else:
+            # verify what actually applied only when the write failed.
+            self.refresh()
+            Log.append(self.apply, 'Warning', 'pmset write failed.', {'settings': pending, 'known': self.known()})
+
+        return success
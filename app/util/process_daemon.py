@@ -37,7 +37,7 @@ class ProcessDaemon:
     def start(self, daemon=True):
         if not self.is_working:
             with self._lock:
-                self._process = common.popen(self._command)
+                self._process = common.popen(self._command, stdin=False, stdout=False, stderr=False)
 
             if daemon:
                 self._t_daemon = Thread(target=self._daemon)
@@ -0,0 +1,87 @@
+import os
+import shlex
+import shutil
+import signal
+from subprocess import Popen
+
+# resolve once, limits apply by exec wrapper in child shell, no preexec_fn.
+_NICE = shutil.which('nice')
+# macOS taskpolicy / linux ionice
+_TASKPOLICY = shutil.which('taskpolicy')
+_IONICE = shutil.which('ionice')
+
+
+class ProcessLimits:
+    """
+    Resource isolation for shell command child: own process group, nice, io throttle and rlimits.
+    Limits are applied by the shell ("ulimit", "nice", "taskpolicy"/"ionice" prefix),
+    Python code never run in the forked child, safe in multithreaded app.
+    Zero or None means unlimited / unchanged.
+    """
+
+    def __init__(self, nice=0, io_throttle=False, cpu_time=0, memory=0, nofile=0):
+        """
+        :param nice: nice increment.
+        :param io_throttle: low disk io priority (macOS taskpolicy -d throttle, linux ionice idle class).
+        :param cpu_time: RLIMIT_CPU, unit: second.
+        :param memory: RLIMIT_AS, unit: MB.
+        :param nofile: RLIMIT_NOFILE.
+        """
+        self.nice = nice
+        self.io_throttle = io_throttle
+        self.cpu_time = cpu_time
+        self.memory = memory
+        self.nofile = nofile
+
+    def _ulimits(self):
+        limits = []
+        if self.cpu_time:
+            limits.append(('-t', int(self.cpu_time)))
+        if self.memory:
+            limits.append(('-v', int(self.memory) * 1024))
+        if self.nofile:
+            limits.append(('-n', int(self.nofile)))
+        return limits
+
+    def _exec_prefix(self):
+        prefix = []
+        if self.nice and _NICE is not None:
+            prefix += [_NICE, '-n', str(int(self.nice))]
+        if self.io_throttle:
+            if _TASKPOLICY is not None:
+                prefix += [_TASKPOLICY, '-d', 'throttle']
+            elif _IONICE is not None:
+                prefix += [_IONICE, '-c', '3']
+        return prefix
+
+    def wrap(self, command: str):
+        """
+        Wrap shell command with limits, run it with shell=True.
+        A limit which the system refuse is skipped, like the unchanged hard limit.
+        """
+        ulimits = ['ulimit %s %d 2>/dev/null;' % (opt, value) for opt, value in self._ulimits()]
+        prefix = self._exec_prefix()
+        if len(ulimits) == 0 and len(prefix) == 0:
+            return command
+        if len(prefix) > 0:
+            command = 'exec %s /bin/sh -c %s' % (' '.join([shlex.quote(p) for p in prefix]), shlex.quote(command))
+        return ' '.join(ulimits + [command])
+
+    def popen_kwargs(self):
+        """
+        Popen kwargs, start child in its own process group (session), setsid is done without preexec_fn.
+        """
+        return {'start_new_session': True}
+
+
+def kill_group(p: Popen, sig=signal.SIGKILL):
+    """
+    Kill process group of child started with start_new_session, fallback to kill process.
+    """
+    try:
+        os.killpg(p.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        try:
+            p.send_signal(sig)
+        except ProcessLookupError:
+            pass
@@ -26,45 +26,55 @@ def battery_status():
 
         return info
     except:
-        Log.append(battery_status, 'Warning', common.get_exception())
+        Log.append_exception(battery_status)
         return None
 
 
+def set_pmset(settings: dict, ex_func, scope='-a'):
+    args = ['%s %s' % (k, v) for k, v in settings.items()]
+    if scope:
+        args.insert(0, scope)
+    return ex_func('/usr/bin/pmset %s' % ' '.join(args))
+
+
 def set_sleep_available(available, ex_func):
-    return ex_func('/usr/bin/pmset -a disablesleep %d' % (0 if available else 1))
+    return set_pmset({'disablesleep': 0 if available else 1}, ex_func)
 
 
 def sleep(display_only=False):
-    return common.execute(['/usr/bin/pmset', 'displaysleepnow' if display_only else 'sleepnow'])
+    return common.execute_discard(['/usr/bin/pmset', 'displaysleepnow' if display_only else 'sleepnow'])
 
 
 def sleep_info():
-    content = common.execute_get_out(['/usr/bin/pmset', '-g', 'live'])
-    reg = re.compile(r'^\s+(?P<key>\S*)\s+(?P<value>\S*)\s*(?P<note>.*)$')
-
-    lines = content.split('\n')
     items = {}
     notes = {}
-    for line in lines:
-        match = reg.match(line)
-        if match is not None:
-            item = match.groupdict()
-            if 'key' in item and 'value' in item:
-                v = item['value']
-                if v.isnumeric():
-                    v = int(v)
-                elif v.replace('.', '', 1).isnumeric():
-                    v = float(v)
-                items[item['key']] = v
-                if item['note'] != '':
-                    notes[item['key']] = item['note']
+    try:
+        content = common.execute_get_out(['/usr/bin/pmset', '-g', 'live'])
+        reg = re.compile(r'^\s+(?P<key>\S*)\s+(?P<value>\S*)\s*(?P<note>.*)$')
+
+        lines = content.split('\n')
+        for line in lines:
+            match = reg.match(line)
+            if match is not None:
+                item = match.groupdict()
+                if 'key' in item and 'value' in item:
+                    v = item['value']
+                    if v.isnumeric():
+                        v = int(v)
+                    elif v.replace('.', '', 1).isnumeric():
+                        v = float(v)
+                    items[item['key']] = v
+                    if item['note'] != '':
+                        notes[item['key']] = item['note']
+    except:
+        Log.append_exception(sleep_info)
 
     return items, notes
 
 
 def set_sleep_mode(mode, ex_func):
     if mode in [0, 3, 25]:
-        return ex_func('/usr/bin/pmset hibernatemode %d' % mode)
+        return set_pmset({'hibernatemode': mode}, ex_func, scope='')
 
 
 def open_url(url, new=False, wait=False, bundle: str = None, p_args=None):
@@ -84,7 +94,7 @@ def open_url(url, new=False, wait=False, bundle: str = None, p_args=None):
         for arg in p_args:
             args.append(arg)
 
-    return common.execute(args)
+    return common.execute_discard(args)
 
 
 def check_process(pid: int = None, name=None):
@@ -153,7 +163,7 @@ def check_admin(username=None):
 
 def sudo(command: str, password: str, timeout=None):
     stat, out, err = common.execute('/usr/bin/sudo -S %s' % (command), '%s\n' % password, timeout, shell=True)
-    Log.append(sudo, 'sudo', locals())
+    Log.append(sudo, 'sudo', locals(), level='Debug')
     return stat, out, err
 
 
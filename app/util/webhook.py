@@ -0,0 +1,235 @@
+import hashlib
+import http.client
+import os
+import time
+from queue import Queue, Empty
+from threading import Thread, Lock
+from urllib.parse import urlsplit
+
+from app.res.const import Const
+from app.util import object_convert
+from app.util.log import Log
+
+
+class WebhookSink:
+    """
+    Forward events to HTTP endpoint.
+    Events in batch window post as one JSON array with a keep-alive connection,
+    failed batches spool to disk, and retry with backoff.
+    Spool directory is per url, batches never post to other endpoint after url changed.
+    """
+    spool_dir_default = os.path.expanduser('~/Library/Caches/%s/webhook' % Const.app_name)
+
+    backoff_min = 1
+    backoff_max = 300
+
+    def __init__(self, url: str, batch_window=0.5, batch_size=100, timeout=5, spool_dir=None,
+                 spool_max_bytes=4 * 1024 * 1024):
+        self.url = url
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+        self.timeout = timeout
+        if spool_dir is None:
+            spool_dir = os.path.join(self.spool_dir_default, hashlib.sha1(url.encode()).hexdigest()[:16])
+        self.spool_dir = spool_dir
+        self.spool_max_bytes = spool_max_bytes
+
+        url_info = urlsplit(url)
+        self._https = url_info.scheme == 'https'
+        self._host = url_info.netloc
+        self._path = url_info.path or '/'
+        if url_info.query:
+            self._path += '?%s' % url_info.query
+
+        self._conn = None  # type: http.client.HTTPConnection
+        self._queue = Queue()
+        self._thread = None  # type: Thread
+        self._lock = Lock()
+        self._backoff = 0
+        self._next_retry_time = 0
+        self._seq = 0
+        self._node = os.uname().nodename
+
+        self.stats = {'events': 0, 'posted': 0, 'failed': 0, 'spooled': 0, 'spool_dropped': 0}
+
+        # retry batches spooled by previous run without waiting for new event.
+        if len(self._spool_files()) > 0:
+            self.start()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name='webhook', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+        self._close()
+
+    def put(self, event: str, params: dict):
+        self.stats['events'] += 1
+        self._queue.put({'event': event, 'time': time.time(), 'host': self._node, 'params': params})
+        self.start()
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _post(self, body: bytes):
+        for retry in [True, False]:
+            try:
+                if self._conn is None:
+                    conn_class = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+                    self._conn = conn_class(self._host, timeout=self.timeout)
+                self._conn.request('POST', self._path, body, {'Content-Type': 'application/json'})
+                resp = self._conn.getresponse()
+                resp.read()
+                if resp.will_close:
+                    self._close()
+                return 200 <= resp.status < 300
+            except (OSError, http.client.HTTPException):
+                # keep-alive connection may be closed by server, reconnect once.
+                self._close()
+                if not retry:
+                    Log.append_exception(self._post)
+        return False
+
+    def _collect(self):
+        """
+        :return: batch, stop
+        """
+        try:
+            event = self._queue.get(timeout=self._next_retry_delay())
+        except Empty:
+            return [], False
+        if event is None:
+            return [], True
+
+        batch = [event]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size:
+            remain = deadline - time.monotonic()
+            if remain <= 0:
+                break
+            try:
+                event = self._queue.get(timeout=remain)
+            except Empty:
+                break
+            if event is None:
+                return batch, True
+            batch.append(event)
+        return batch, False
+
+    def _next_retry_delay(self):
+        if len(self._spool_files()) == 0:
+            return None
+        return max(0.0, self._next_retry_time - time.monotonic())
+
+    def _run(self):
+        while True:
+            batch, stop = self._collect()
+            if len(batch) > 0:
+                body = object_convert.to_json_line(batch).encode()
+                # keep order, post new batch directly only if spool is empty.
+                spooled = len(self._spool_files()) > 0
+                if not spooled and self._post(body):
+                    self.stats['posted'] += 1
+                else:
+                    if not spooled:
+                        self.stats['failed'] += 1
+                        self._retry_failed()
+                    self._spool(body)
+            if stop:
+                break
+            try:
+                self._retry_spool()
+            except OSError:
+                # spool directory unreadable, keep the sender alive and retry later.
+                Log.append_exception(self._run)
+                self._retry_failed()
+
+    def _retry_failed(self):
+        self._backoff = min(self.backoff_max, max(self.backoff_min, self._backoff * 2))
+        self._next_retry_time = time.monotonic() + self._backoff
+
+    def _retry_spool(self):
+        while time.monotonic() >= self._next_retry_time:
+            files = self._spool_files()
+            if len(files) == 0:
+                self._backoff = 0
+                break
+
+            path = os.path.join(self.spool_dir, files[0])
+            try:
+                with open(path, 'rb') as io:
+                    body = io.read()
+            except OSError:
+                Log.append_exception(self._retry_spool)
+                if not self._quarantine(path):
+                    self._retry_failed()
+                    break
+                continue
+            if not self._post(body):
+                self.stats['failed'] += 1
+                self._retry_failed()
+                break
+            self.stats['posted'] += 1
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                Log.append_exception(self._retry_spool)
+                if not self._quarantine(path):
+                    self._retry_failed()
+                    break
+
+    def _quarantine(self, path):
+        """
+        Move unusable spool file out of the retry queue ("*.json.bad"), or delete it.
+        :return: False if the file still in the queue.
+        """
+        self.stats['spool_dropped'] += 1
+        for func, args in [(os.replace, (path, path + '.bad')), (os.unlink, (path,))]:
+            try:
+                func(*args)
+                return True
+            except FileNotFoundError:
+                return True
+            except OSError:
+                Log.append_exception(self._quarantine)
+        return False
+
+    def _spool_files(self):
+        if not os.path.isdir(self.spool_dir):
+            return []
+        return sorted([f for f in os.listdir(self.spool_dir) if f.endswith('.json')])
+
+    def _spool(self, body: bytes):
+        try:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            files = self._spool_files()
+            sizes = [os.path.getsize(os.path.join(self.spool_dir, f)) for f in files]
+            # drop oldest batches keep spool bounded.
+            while len(files) > 0 and sum(sizes) + len(body) > self.spool_max_bytes:
+                os.unlink(os.path.join(self.spool_dir, files.pop(0)))
+                sizes.pop(0)
+                self.stats['spool_dropped'] += 1
+            if len(body) > self.spool_max_bytes:
+                self.stats['spool_dropped'] += 1
+                return
+
+            self._seq += 1
+            path = os.path.join(self.spool_dir, '%017.6f_%06d.json' % (time.time(), self._seq))
+            with open(path + '.tmp', 'wb') as io:
+                io.write(body)
+            os.rename(path + '.tmp', path)
+            self.stats['spooled'] += 1
+        except OSError:
+            Log.append_exception(self._spool)
@@ -41,6 +41,8 @@ shutil.rmtree('./build', ignore_errors=True)
 shutil.rmtree('./dist', ignore_errors=True)
 
 add_data('./app/res/icon.png', './app/res')
+# privileged helper run as script by the app executable (admin_helper.FROZEN_ARG).
+add_data('./app/util/admin_helper.py', './app/util')
 
 path_app_dir = './dist/%s.app' % Const.app_name
 path_app_zip = './dist/%s-%s.zip' % (Const.app_name, Const.version)
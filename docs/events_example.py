@@ -1,4 +1,8 @@
 #!/usr/local/bin/python3
+# Usage:
+#   shell hook: "/path/to/events_example.py lid", params passing through environment SLEEPERX_ENV.
+#   plugin hook: "py:/path/to/events_example.py", import once and call event_* function in SleeperX process.
+#   worker hook: "worker:/path/to/events_example.py --loop", keep running and read one JSON event per line on stdin.
 import os
 import time
 
@@ -42,7 +46,16 @@ if __name__ == '__main__':
     from_json = lambda x: json.loads(x)
 
     env = os.environ
-    if len(sys.argv) >= 2:
+    if '--loop' in sys.argv:
+        for line in sys.stdin:
+            try:
+                data = from_json(line)
+                func = globals().get('event_%s' % data['event'])
+                if func is not None:
+                    func(**data['params'])
+            except Exception as e:
+                print(repr(e), file=sys.stderr)
+    elif len(sys.argv) >= 2:
         event = sys.argv[1]
         events = {
             'idle': event_idle_status_changed,
@@ -0,0 +1,22 @@
+"""
+Import app modules in test without the app package __init__, which need rumps (macOS only).
+"""
+import importlib
+import os
+import sys
+import types
+
+PATH_APP = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+
+def import_app_module(name):
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        pass
+
+    # bare "app" package, its submodules import as usual.
+    package = types.ModuleType('app')
+    package.__path__ = [PATH_APP]
+    sys.modules['app'] = package
+    return importlib.import_module(name)
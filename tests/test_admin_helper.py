@@ -0,0 +1,89 @@
+"""
+Drive the privileged helper with an unprivileged pmset stand-in (/bin/echo).
+"""
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+PATH_MODULE = os.path.join(os.path.dirname(__file__), '..', 'app', 'util', 'admin_helper.py')
+
+# standalone module, load it without the app package (which needs rumps).
+_spec = importlib.util.spec_from_file_location('admin_helper', PATH_MODULE)
+admin_helper = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(admin_helper)
+
+
+def wait_until(check, timeout, interval=0.1):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if check():
+            return True
+        time.sleep(interval)
+    return check()
+
+
+@unittest.skipUnless(os.path.exists('/bin/echo'), 'need /bin/echo as pmset stand-in.')
+class AdminHelperTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'helper.sock')
+        # stand-in of the app process, the helper exits when it is gone.
+        self.parent = subprocess.Popen(['sleep', '60'])
+        self.helper = subprocess.Popen([
+            sys.executable, PATH_MODULE, '--socket', self.path, '--uid', str(os.getuid()),
+            '--ppid', str(self.parent.pid), '--pmset', '/bin/echo', '--timeout', '5'])
+        self.client = admin_helper.AdminHelperClient(self.path, timeout=5)
+        self.assertTrue(wait_until(self.client.ping, 5), 'helper not started.')
+
+    def tearDown(self):
+        self.client.close()
+        for p in [self.helper, self.parent]:
+            if p.poll() is None:
+                p.kill()
+            p.wait()
+        self.dir.cleanup()
+
+    def test_ping(self):
+        self.assertTrue(self.client.ping())
+
+    def test_exec_allowed(self):
+        [status, out, _] = self.client.exec('/usr/bin/pmset -a disablesleep 1')
+        self.assertEqual(status, 0)
+        self.assertEqual(out.strip(), '-a disablesleep 1')
+
+        [status, out, _] = self.client.exec('/usr/bin/pmset sleepnow')
+        self.assertEqual(status, 0)
+        self.assertEqual(out.strip(), 'sleepnow')
+
+    def test_exec_rejected(self):
+        for command in [
+            '/usr/bin/pmset -a disablesleep 2',
+            '/usr/bin/pmset -a autopoweroff 1',
+            '/bin/sh -c id',
+            '/usr/bin/pmset -a disablesleep 1; id',
+        ]:
+            [status, _, err] = self.client.exec(command)
+            self.assertEqual(status, -1, command)
+            self.assertIn('not allowed', err)
+
+    def test_launch_command_quoted(self):
+        command = admin_helper.launch_command('/Applications/My App.app/python', '/tmp/a b.sock', 501, 42,
+                                              script='/x y/admin_helper.py')
+        self.assertEqual(command, "'/Applications/My App.app/python' '/x y/admin_helper.py' "
+                                  "--socket '/tmp/a b.sock' --uid 501 --ppid 42 --daemon")
+
+    def test_parent_death(self):
+        self.parent.kill()
+        self.parent.wait()
+
+        # parent is checked every 3 seconds.
+        self.assertTrue(wait_until(lambda: self.helper.poll() is not None, 10), 'helper still running.')
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
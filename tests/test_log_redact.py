@@ -0,0 +1,46 @@
+import unittest
+
+from support import import_app_module
+
+Log = import_app_module('app.util.log').Log
+
+
+class LogRedactTest(unittest.TestCase):
+    def tearDown(self):
+        Log.set_replaces({})
+
+    def test_overlap(self):
+        Log.set_replaces({'abc': '[A]', 'abcdef': '[B]'})
+        self.assertEqual(Log.redact('x abcdef y abc z abcde'), 'x [B] y [A] z [A]de')
+
+        # declared order does not matter.
+        Log.set_replaces({'abcdef': '[B]', 'abc': '[A]'})
+        self.assertEqual(Log.redact('abcdefabc'), '[B][A]')
+
+    def test_empty_and_none_keys(self):
+        Log.set_replaces({'': '[E]', None: '[N]', 'pw': '[P]'})
+        self.assertEqual(Log.redact('a pw None b'), 'a [P] None b')
+
+        Log.set_replaces({'': '[E]', None: '[N]'})
+        self.assertIsNone(Log.reg_replaces)
+        self.assertEqual(Log.redact('a None b'), 'a None b')
+
+    def test_rebuild(self):
+        Log.set_replaces({'old_secret': '[P]'})
+        self.assertEqual(Log.redact('old_secret'), '[P]')
+
+        Log.set_replaces({'new_secret': '[P]'})
+        self.assertEqual(Log.redact('old_secret new_secret'), 'old_secret [P]')
+
+    def test_regex_metacharacters(self):
+        Log.set_replaces({'a.b*c': '[1]', '(x|y)': '[2]', '\\d+': '[3]', '[z]': '[4]'})
+        self.assertEqual(Log.redact('a.b*c (x|y) \\d+ [z]'), '[1] [2] [3] [4]')
+        self.assertEqual(Log.redact('aXbc abbbc x y 123 z'), 'aXbc abbbc x y 123 z')
+
+    def test_json_escaped(self):
+        Log.set_replaces({'pa"ss': '[P]'})
+        self.assertEqual(Log.redact('{"pw": "pa\\"ss"} pa"ss'), '{"pw": "[P]"} [P]')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+"""
+Drive the webhook sink against a local stand-in HTTP server.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from unittest import mock
+
+from support import import_app_module
+
+WebhookSink = import_app_module('app.util.webhook').WebhookSink
+
+
+def wait_until(check, timeout, interval=0.05):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if check():
+            return True
+        time.sleep(interval)
+    return check()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        server = self.server
+        with server.lock:
+            status = server.statuses.pop(0) if len(server.statuses) > 0 else 200
+            if status == 200:
+                server.requests.append((self.path, self.client_address[1], json.loads(body)))
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class WebhookSinkTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.lock = threading.Lock()
+        self.server.statuses = []
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.dir = tempfile.TemporaryDirectory()
+        self.sinks = []
+
+    def tearDown(self):
+        for sink in self.sinks:
+            sink.stop(timeout=5)
+        self.server.shutdown()
+        self.server.server_close()
+        self.dir.cleanup()
+
+    def url(self, path='/hook'):
+        return 'http://127.0.0.1:%d%s' % (self.server.server_address[1], path)
+
+    def sink(self, url, **kwargs):
+        kwargs.setdefault('batch_window', 0.2)
+        sink = WebhookSink(url, timeout=5, **kwargs)
+        sink.backoff_min = 0.1
+        self.sinks.append(sink)
+        return sink
+
+    def events(self):
+        with self.server.lock:
+            return [e['params']['i'] for _, _, batch in self.server.requests for e in batch]
+
+    def test_batch_and_keep_alive(self):
+        sink = self.sink(self.url(), spool_dir=self.dir.name)
+        for i in range(3):
+            sink.put('e', {'i': i})
+        self.assertTrue(wait_until(lambda: len(self.server.requests) == 1, 5))
+        sink.put('e', {'i': 3})
+        self.assertTrue(wait_until(lambda: len(self.server.requests) == 2, 5))
+
+        [[path, port_1, batch_1], [_, port_2, batch_2]] = self.server.requests
+        self.assertEqual(path, '/hook')
+        self.assertEqual([e['event'] for e in batch_1], ['e', 'e', 'e'])
+        self.assertEqual(self.events(), [0, 1, 2, 3])
+        self.assertEqual(len(batch_2), 1)
+        # second batch reuse the connection.
+        self.assertEqual(port_1, port_2)
+
+    def test_spool_and_retry_in_order(self):
+        self.server.statuses = [500, 500]
+        sink = self.sink(self.url(), spool_dir=self.dir.name)
+        sink.put('e', {'i': 0})
+        self.assertTrue(wait_until(lambda: sink.stats['spooled'] == 1, 5))
+        # spool not empty, new batch queue behind it.
+        sink.put('e', {'i': 1})
+
+        self.assertTrue(wait_until(lambda: self.events() == [0, 1], 10), self.events())
+        self.assertEqual(sink.stats['failed'], 2)
+        self.assertEqual(os.listdir(self.dir.name), [])
+
+    def test_spool_per_url_and_resume(self):
+        with mock.patch.object(WebhookSink, 'spool_dir_default', self.dir.name):
+            self.server.statuses = [500]
+            sink = self.sink(self.url('/a'))
+            sink.put('e', {'i': 0})
+            self.assertTrue(wait_until(lambda: sink.stats['spooled'] == 1, 5))
+            sink.stop(timeout=5)
+
+            # other url never post the spooled batch.
+            sink_b = self.sink(self.url('/b'))
+            self.assertNotEqual(sink_b.spool_dir, sink.spool_dir)
+            time.sleep(0.3)
+            self.assertEqual(self.server.requests, [])
+
+            # same url resume without new event.
+            self.sink(self.url('/a'))
+            self.assertTrue(wait_until(lambda: len(self.server.requests) == 1, 5))
+            self.assertEqual(self.server.requests[0][0], '/a')
+            self.assertEqual(self.events(), [0])
+
+
+if __name__ == '__main__':
+    unittest.main()
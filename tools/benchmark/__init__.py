@@ -0,0 +1,28 @@
+import os
+import resource
+import sys
+import time
+
+
+def cpu_time():
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    child_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return sum([self_usage.ru_utime, self_usage.ru_stime, child_usage.ru_utime, child_usage.ru_stime])
+
+
+def bench(name, func, count):
+    func()  # warm up.
+    t = time.perf_counter()
+    c = cpu_time()
+    for _ in range(count):
+        func()
+    t = time.perf_counter() - t
+    c = cpu_time() - c
+    result = {'name': name, 'count': count, 'ops': count / t, 'cpu_us': c / count * 1000000}
+    # stdout may be redirected by benchmark target.
+    print('%-24s %10.1f ops/s %10.1f us cpu/op' % (name, result['ops'], result['cpu_us']), file=sys.__stdout__)
+    return result
+
+
+def count_from_env(default):
+    return int(os.environ.get('BENCH_COUNT', default))
@@ -0,0 +1,66 @@
+"""
+Log.append throughput benchmark.
+usage: python3 -m tools.benchmark.log
+"""
+import sys
+import tempfile
+import time
+
+from app.util import object_convert
+from app.util.log import Log
+from tools.benchmark import bench, count_from_env
+
+
+def legacy_append(src, tag='Info', *args):
+    # Log.append before async writer: format, lock, print and flush on every call.
+    log_items = []
+    for i in args:
+        if isinstance(i, list) or isinstance(i, dict):
+            log_items.append(object_convert.to_json(i))
+        else:
+            log_items.append(i)
+
+    source = src if isinstance(src, str) else src.__name__
+    items_str = []
+    for item in log_items:
+        item_str = str(item)
+        for k, v in Log.replaces.items():
+            if k is not None and k != '':
+                item_str = item_str.replace(k, v)
+        items_str.append(item_str)
+    items_str = ' '.join(items_str)
+
+    with Log.lock_log:
+        print('[%s] %s %s\n\t' % (tag, time.ctime(), source), items_str)
+        sys.stdout.flush()
+
+
+def main():
+    count = count_from_env(20000)
+    Log.set_replaces({'secret_password': '[protector]'})
+    data = {'command': '/usr/bin/pmset -a disablesleep 1', 'status': 0, 'output': '', 'error': ''}
+
+    with tempfile.TemporaryFile('w+') as io:
+        stdout = sys.stdout
+        sys.stdout = io
+        try:
+            bench('legacy append str', lambda: legacy_append('bench', 'Info', 'message'), count)
+            bench('append str', lambda: Log.append('bench', 'Info', 'message'), count)
+            bench('legacy append dict', lambda: legacy_append('bench', 'Info', data), count)
+            bench('append dict', lambda: Log.append('bench', 'Info', data), count)
+            Log.flush()
+
+            # structured record only, compare with text record of the same argument.
+            bench('append_json str', lambda: Log.append_json('bench', 'Info', ('message',)), count)
+            bench('append_json dict', lambda: Log.append_json('bench', 'Info', (data,)), count)
+            Log.queue_json.clear()
+            Log.set_format('both')
+            bench('append both dict', lambda: Log.append('bench', 'Info', data), count)
+            Log.flush()
+            Log.set_format('text')
+        finally:
+            sys.stdout = stdout
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""
+Spawn benchmark of common.execute modes.
+usage: python3 -m tools.benchmark.spawn
+"""
+from subprocess import PIPE, Popen
+
+from app import common
+from tools.benchmark import bench, count_from_env
+
+CMD = ['/usr/bin/true']
+
+
+def legacy_execute(cmd, input_str=None, **kwargs):
+    # common.execute before lean modes: all pipes, text mode, close_fds.
+    p = Popen(cmd, stdin=PIPE, stdout=PIPE, stderr=PIPE, encoding='utf-8', **kwargs)
+    out, err = p.communicate(input_str)
+    return p.returncode, out, err
+
+
+def main():
+    count = count_from_env(500)
+    env = {'BENCH': '1'}
+    bench('legacy execute', lambda: legacy_execute(CMD), count)
+    bench('execute', lambda: common.execute(CMD), count)
+    bench('execute stdout only', lambda: common.execute(CMD, stderr=False), count)
+    bench('execute bytes', lambda: common.execute(CMD, text=False), count)
+    bench('execute discard', lambda: common.execute_discard(CMD), count)
+    bench('execute sys env', lambda: common.execute(CMD, env=env, stdout=False, stderr=False), count)
+    bench('legacy shell', lambda: legacy_execute(' '.join(CMD), shell=True), count)
+    bench('execute shell', lambda: common.execute(' '.join(CMD), shell=True), count)
+
+
+if __name__ == '__main__':
+    main()